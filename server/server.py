@@ -13,9 +13,12 @@ from .utils import get_sanitized_args
 from itertools import chain
 from dotenv import load_dotenv
 import solver.geometric_median as gm
+import solver.median_cache as median_cache
+import solver.median_pyramid as median_pyramid
 from PIL import Image
 import numpy as np
 import solver.binar_solver as binary_solver
+import solver.interpreter as interpreter
 import solver.pixel as pix
 
 from os import listdir
@@ -32,6 +35,9 @@ CORS(app)
 os.path.basename(__file__)
 
 IMG_CACHE = {}
+INITIAL_STATE_CACHE = {}
+PYRAMID_CACHE = {}
+MEDIAN_CACHE = median_cache.MedianCache()
 
 
 def open_image_as_np(n):
@@ -47,6 +53,14 @@ def open_image_as_np(n):
     return result
 
 
+def get_initial_state(n):
+    global INITIAL_STATE_CACHE
+
+    if n not in INITIAL_STATE_CACHE:
+        INITIAL_STATE_CACHE[n] = interpreter.load_initial_state(n)
+    return INITIAL_STATE_CACHE[n]
+
+
 @app.route("/")
 def ping():
     return "pong"
@@ -94,11 +108,35 @@ def get_geometric_median():
     id = payload["id"]
     x1, x2, y1, y2 = payload["x1"], payload["x2"], payload["y1"], payload["y2"]
     img = open_image_as_np(id)
-    subimg = img[x1:x2, y1:y2]
 
-    color = [round(v) for v in gm.geometric_median(
-        subimg.reshape((subimg.shape[0] * subimg.shape[1], 4)), eps=1e-2)]
-    return {'color': color}
+    # optional: answer from the median pyramid if it can't cost more similarity than this
+    tolerance = payload.get("tolerance")
+    if tolerance is not None:
+        if id not in PYRAMID_CACHE:
+            PYRAMID_CACHE[id] = median_pyramid.load_pyramid(id, img)
+        color, error = PYRAMID_CACHE[id].query(x1, y1, x2, y2, max_error=tolerance)
+        if color is not None:
+            return {'color': [round(v) for v in color], 'error': error}
+
+    median = MEDIAN_CACHE.get(id, "pixels", 1e-2, x1, y1, x2, y2)
+    if median is None:
+        subimg = img[x1:x2, y1:y2]
+        median = gm.geometric_median(subimg.reshape((subimg.shape[0] * subimg.shape[1], 4)), eps=1e-2)
+        MEDIAN_CACHE.put(id, "pixels", 1e-2, x1, y1, x2, y2, median)
+    return {'color': [round(v) for v in median]}
+
+
+@app.post("/score")
+def post_score():
+    payload = request.get_json()
+    problem_id = payload["problem_id"]
+    solution = payload["solution"]
+    try:
+        result = interpreter.score_program(
+            open_image_as_np(problem_id), solution, get_initial_state(problem_id))
+    except interpreter.InvalidMove as err:
+        return {'error': str(err), 'line': err.line}
+    return {'cost': result.cost, 'similarity': result.similarity, 'total': result.total}
 
 
 @app.post("/run_solver")
@@ -200,6 +238,9 @@ def post_solution(problem_id):
     payload = request.get_json()
     solution = payload.get('solution')
     assert solution, 'Required input: solution'
+    errors = interpreter.check_program(solution, get_initial_state(int(problem_id)), max_errors=10)
+    if errors:
+        return {'errors': [{'line': err.line, 'message': err.message} for err in errors]}, 400
     return ICFPC.submit(problem_id, solution)
 
 
@@ -228,6 +269,9 @@ def post_submit():
     solution = payload.get('solution')
     assert problem, 'Required input: problem'
     assert solution, 'Required input: solution'
+    errors = interpreter.check_program(solution, get_initial_state(int(problem)), max_errors=10)
+    if errors:
+        return {'errors': [{'line': err.line, 'message': err.message} for err in errors]}, 400
     return ICFPC.submit(problem, solution)
 
 @app.get('/icfpc/<path:path>')
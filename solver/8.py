@@ -2,11 +2,12 @@
 
 from src.utils import open_as_np
 
-from solver.geometric_median import geometric_median
+from solver.palette import PaletteImage
 
-from collections import defaultdict
 import math
 
+import numpy as np
+
 class Block:
     def __init__(self, name, begin, end):
         self.name = name
@@ -118,19 +119,13 @@ class TextSolver:
         return Block(cur_name, cur.begin, cur.end)
 
     def find_blocks(self, block):
-        pixels = open_as_np('8')
-
-        colors = defaultdict(list)
-        count = defaultdict(int)
-
-        for y in range(400):
-            for x in range(400):
-                col = tuple(pixels[x, y, :])
-                colors[col].append((x, y))
-                count[col] += 1
+        img = PaletteImage(open_as_np('8'))
 
-        items = list(count.items())
-        items.sort(key = lambda x: x[1], reverse=True)
+        # colors by count, ties in order of first appearance row by row
+        ids, first, counts = np.unique(img.index.T.ravel(), return_index=True, return_counts=True)
+        order = np.lexsort((first, -counts))
+        items = [(tuple(int(v) for v in img.palette[ids[i]]), int(counts[i])) for i in order]
+        palette_ids = {items[k][0]: ids[i] for k, i in enumerate(order)}
 
         taken = [(255, 255, 255, 255)]
 
@@ -147,16 +142,11 @@ class TextSolver:
                 continue
 
             print(item)
-            x0 = min(map(lambda a: a[0], colors[col]))
-            y0 = min(map(lambda a: a[1], colors[col]))
-
-            x1 = max(map(lambda a: a[0], colors[col]))
-            y1 = max(map(lambda a: a[1], colors[col]))
-            
-            subimg = pixels[x0:x1, y0:y1]
+            xs, ys = np.nonzero(img.index == palette_ids[col])
+            x0, x1 = int(xs.min()), int(xs.max())
+            y0, y1 = int(ys.min()), int(ys.max())
 
-            color = [round(v) for v in geometric_median(
-                    subimg.reshape((subimg.shape[0] * subimg.shape[1], 4)), eps=1e-2)]
+            color = [round(v) for v in img.geometric_median(x0, y0, x1, y1, eps=1e-2)]
 
             block = self.draw_rect(block, [x0, y0], [x1, y1], to_color(color))
 
@@ -6,18 +6,49 @@ except ImportError:
 import dataclasses
 import numpy as np
 import typing
-import itertools
 import os
 from PIL import Image
 import numpy as np
 import time
 
 try:
-    import geometric_median as gm
+    import interpreter
 except ImportError:
-    import solver.geometric_median as gm
+    import solver.interpreter as interpreter
 
-import json
+try:
+    import integral_image
+except ImportError:
+    import solver.integral_image as integral_image
+
+try:
+    import palette
+except ImportError:
+    import solver.palette as palette
+
+try:
+    import color_search
+except ImportError:
+    import solver.color_search as color_search
+
+try:
+    import median_pyramid
+except ImportError:
+    import solver.median_pyramid as median_pyramid
+
+try:
+    import median_cache
+except ImportError:
+    import solver.median_cache as median_cache
+
+try:
+    import lru_cache
+except ImportError:
+    import solver.lru_cache as lru_cache
+
+import contextlib
+import multiprocessing
+from multiprocessing import shared_memory
 
 PROBLEMS_DIR = "./problems"
 
@@ -120,6 +151,19 @@ class Program:
     score: float
 
 
+@dataclasses.dataclass
+class Plan:
+    """Decision for one (shape, color) of Solver.improve. Sub-blocks (and the
+    same block after a recolor) point to their own plans, so a plan stays whole
+    when Solver.cache evicts them; the commands are only built for the final
+    program."""
+    kind: str  # leave, color, cut_x, cut_y or cut_xy
+    score: float
+    position: typing.Tuple[int, ...] = ()
+    color: typing.List[int] = None
+    children: typing.Tuple["Plan", ...] = ()
+
+
 @dataclasses.dataclass
 class Block:
     block_id: str
@@ -138,39 +182,19 @@ class InitialJSON:
 
 
 def read_initial_json(n) -> InitialJSON:
-    with open(f"{PROBLEMS_DIR}/{n}.initial.json", "rt") as f:
-        json_obj = json.load(f)
-        return InitialJSON(
-            width=json_obj["width"],
-            height=json_obj["height"],
-            blocks=[
-                Block(
-                    block_id=block_obj["blockId"],
-                    shape=Shape(
-                        x1=block_obj["bottomLeft"][0],
-                        y1=block_obj["bottomLeft"][1],
-                        x2=block_obj["topRight"][0],
-                        y2=block_obj["topRight"][1]),
-                    color=block_obj["color"])
-                for block_obj in json_obj["blocks"]
-            ])
-
-
-@dataclasses.dataclass
-class QuadTreeNode:
-    zoom: int
-    shape: Shape
-    med_color: typing.List[int]
-    children: typing.List["QuadTreeNode"]
-
-    def query(self, shape: Shape, max_zoom=-1):
-        if shape.contains(self.shape):
-            return [self]
-        if not shape.overlaps(self.shape):
-            return []
-        if not self.children or (max_zoom >=0 and self.zoom >= max_zoom):
-            return [self]
-        return itertools.chain.from_iterable([child.query(shape) for child in self.children])
+    # png blocks (problems 36+) have no color, use the mean of their pixels on the rendered canvas
+    initial = interpreter.load_initial_state(n)
+    return InitialJSON(
+        width=initial.width,
+        height=initial.height,
+        blocks=[
+            Block(
+                block_id=b.block_id,
+                shape=Shape(x1=b.x1, y1=b.y1, x2=b.x2, y2=b.y2),
+                color=list(b.color) if b.color is not None else
+                    np.round(initial.canvas[b.x1:b.x2, b.y1:b.y2].mean(axis=(0, 1))).astype(int).tolist())
+            for b in initial.blocks
+        ])
 
 
 MED_COLOR_TIME = 0
@@ -178,29 +202,67 @@ FAST_MED_COLOR_TIME = 0
 
 
 class Solver:
-    def __init__(self, ref_img, max_depth=4, initial_blocks=None):
+    def __init__(self, ref_img, max_depth=4, initial_blocks=None, exact_colors=False, median_tolerance=0.0,
+                 problem_id=None, cache_entries=None, cache_bytes=None, color_cache_entries=None,
+                 color_cache_bytes=None, workers=1, parallel_depth=1):
         self.ref_img = ref_img
         self.max_depth = max_depth
-        self.cache = {}
-        self.avg_color_cache = {}
+        # same settings for the solvers of the worker processes
+        self.worker_args = dict(max_depth=max_depth, exact_colors=exact_colors, median_tolerance=median_tolerance,
+                                problem_id=problem_id, cache_entries=cache_entries, cache_bytes=cache_bytes,
+                                color_cache_entries=color_cache_entries, color_cache_bytes=color_cache_bytes)
+        # with workers > 1, the blocks at parallel_depth are solved in a process pool
+        self.workers = workers
+        self.parallel_depth = parallel_depth
+        self.pool = None
+        # cache key -> AsyncResult of the blocks being solved in the pool
+        self.pending = {}
+        # replace rounded medians by the best integer color of the block
+        self.exact_colors = exact_colors
+        # LRU memo tables, unbounded unless given an entry or byte budget
+        self.cache = lru_cache.LRUCache(max_entries=cache_entries, max_bytes=cache_bytes)
+        self.avg_color_cache = lru_cache.LRUCache(max_entries=color_cache_entries, max_bytes=color_cache_bytes)
+        # medians shared with other runs and the server, needs the problem id
+        self.problem_id = problem_id
+        self.median_cache = median_cache.MedianCache() if problem_id is not None else None
         self.initial_blocks = initial_blocks or []
         self.med_color_quad_tree = None
+        # pyramid medians are used when they can't cost more similarity than this
+        self.median_tolerance = median_tolerance
+        self.color_tables = integral_image.ColorDistanceTables(ref_img)
+        self.palette_img = palette.PaletteImage(ref_img)
 
     def subimage(self, sp: Shape):
         return self.ref_img[sp.x1:sp.x2, sp.y1:sp.y2]
 
+    def similarity_to_color(self, sp: Shape, color):
+        return self.color_tables.float_simil(color, sp.x1, sp.y1, sp.x2, sp.y2)
+
     def compute_geom_med_color(self, sp: Shape):
-        subimg = self.subimage(sp)
-        return [round(v) for v in gm.geometric_median(
-            subimg.reshape((subimg.shape[0] * subimg.shape[1], 4)), eps=0.5)]
+        median = None
+        if self.median_cache is not None:
+            median = self.median_cache.get(self.problem_id, "palette", 0.5, sp.x1, sp.y1, sp.x2, sp.y2)
+        if median is None:
+            # over the distinct colors of the block, weighted by their counts
+            median = self.palette_img.geometric_median(sp.x1, sp.y1, sp.x2, sp.y2, eps=0.5)
+            if self.median_cache is not None:
+                self.median_cache.put(self.problem_id, "palette", 0.5, sp.x1, sp.y1, sp.x2, sp.y2, median)
+        return self.refine_color(sp, [round(v) for v in median])
+
+    def refine_color(self, sp: Shape, color):
+        if self.exact_colors:
+            colors, counts = self.palette_img.colors(sp.x1, sp.y1, sp.x2, sp.y2)
+            color = color_search.best_color(colors, color, weights=counts)
+        return color
 
     def get_geom_med_color(self, sp: Shape):
         global MED_COLOR_TIME
         global FAST_MED_COLOR_TIME
 
         avg_color_cache_key = (sp.x1, sp.x2, sp.y1, sp.y2)
-        if avg_color_cache_key in self.avg_color_cache:
-            return self.avg_color_cache[avg_color_cache_key]
+        med_color = self.avg_color_cache.get(avg_color_cache_key)
+        if med_color is not None:
+            return med_color
 
         # start = time.time()
         # subimg = self.subimage(sp)
@@ -217,46 +279,37 @@ class Solver:
         #     max_zoom += 1
         #     zoom_limit /= 2
 
-        start = time.time()
-        med_color = self.compute_geom_med_color(sp)
-        end = time.time()
-        MED_COLOR_TIME += (end - start)
+        med_color = None
+        if self.med_color_quad_tree is not None:
+            start = time.time()
+            med_color = self.fast_med_color(sp)
+            end = time.time()
+            FAST_MED_COLOR_TIME += (end - start)
 
-
-        # med_color = self.fast_med_color(sp)
-        # FAST_MED_COLOR_TIME += (end - start)
-        # # diff = np.array(med_color) - np.array(fast_med_color)
-        # # print(f"fast geometric_median took {end - start}, diff={diff} (TOTAL={FAST_MED_COLOR_TIME})")
+        if med_color is None:
+            start = time.time()
+            med_color = self.compute_geom_med_color(sp)
+            end = time.time()
+            MED_COLOR_TIME += (end - start)
 
         self.avg_color_cache[avg_color_cache_key] = med_color
 
         return med_color
 
-    def precompute_quad_tree(self):
-        max_zoom = 6
-
-        def create_node(zoom, shape: Shape):
-            if zoom + 1 < max_zoom:
-                mid_x = round(shape.x1 + shape.w / 2)
-                mid_y = round(shape.y1 + shape.h / 2)
-                children = [create_node(zoom=zoom + 1, shape=sp)
-                            for sp in shape.split_xy(mid_x, mid_y)]
-            else:
-                children = []
-            return QuadTreeNode(
-                zoom=zoom, shape=shape, med_color=self.compute_geom_med_color(shape), children=children)
-        self.med_color_quad_tree = create_node(
-            zoom=0, shape=Shape(0, 0, 400, 400))
+    def precompute_quad_tree(self, n=None):
+        """Median pyramid of the image, cached on disk when the problem id is known"""
+        if n is not None:
+            self.med_color_quad_tree = median_pyramid.load_pyramid(n, self.ref_img)
+        else:
+            self.med_color_quad_tree = median_pyramid.MedianPyramid.build(self.ref_img)
 
     def fast_med_color(self, shape):
-        nodes = list(self.med_color_quad_tree.query(shape))
-        med_colors = []
-        max_zoom = max([node.zoom for node in nodes])
-        for node in nodes:
-            mult = 1 << (max_zoom - node.zoom)
-            med_colors.extend([node.med_color] * mult)
-
-        return [round(v) for v in gm.geometric_median(np.array(med_colors), eps=0.5)]
+        """Median color from the pyramid, or None if its error bound is above the tolerance"""
+        color, _ = self.med_color_quad_tree.query(shape.x1, shape.y1, shape.x2, shape.y2,
+                                                  max_error=self.median_tolerance)
+        if color is None:
+            return None
+        return self.refine_color(shape, [round(v) for v in color])
 
     def get_x_splits(self, sp: Shape):
         if sp.w > 100:
@@ -280,91 +333,107 @@ class Solver:
         else:
             return []
 
+    def plan_key(self, sp: Shape, current_color, depth, try_recolor=True):
+        """Key of Solver.cache: everything improve_plan depends on, so a cached plan
+        is the one the call would return, whatever was solved before"""
+        return tuple([sp.x1, sp.x2, sp.y1, sp.y2] + list(current_color) + [depth, try_recolor])
+
     def improve(self, block_id: str, sp: Shape, current_color, depth, try_recolor=True) -> Program:
-        # print(f"improve {block_id} at {sp} depth {depth}")
+        if self.workers > 1:
+            with self.worker_pool():
+                plan = self.improve_plan(sp, current_color, depth, try_recolor)
+        else:
+            plan = self.improve_plan(sp, current_color, depth, try_recolor)
+        return Program(cmds=self.plan_cmds(plan, block_id), score=plan.score)
 
-        cache_key = tuple([sp.x1, sp.x2, sp.y1, sp.y2] + list(current_color))
-        if cache_key in self.cache:
-            o = self.cache[cache_key]
-            return Program(cmds=[cmd.replace("$", block_id) for cmd in o.cmds], score=o.score)
+    def plan_cmds(self, plan: Plan, block_id: str) -> typing.List[str]:
+        """Commands of a plan, walking the plans of its sub-blocks"""
+        cmds = []
+        while plan is not None:
+            next_plan = None
+            if plan.kind == "color":
+                cmds.append(f"color [{block_id}] {plan.color}")
+                if plan.children:
+                    # improved again after the recolor, same block
+                    next_plan = plan.children[0]
+            elif plan.kind != "leave":
+                if plan.kind == "cut_x":
+                    cmds.append(f"cut [{block_id}] [x] [{plan.position[0]}]")
+                elif plan.kind == "cut_y":
+                    cmds.append(f"cut [{block_id}] [y] [{plan.position[0]}]")
+                else:
+                    cmds.append(f"cut [{block_id}] [{plan.position[0]}, {plan.position[1]}]")
+                for i, child in enumerate(plan.children):
+                    cmds.extend(self.plan_cmds(child, f"{block_id}.{i}"))
+            plan = next_plan
+        return cmds
+
+    def improve_plan(self, sp: Shape, current_color, depth, try_recolor=True) -> Plan:
+        """Best plan for the block, memoized in self.cache"""
+        # print(f"improve at {sp} depth {depth}")
+
+        cache_key = self.plan_key(sp, current_color, depth, try_recolor)
+        plan = self.cache.get(cache_key)
+        if plan is None and cache_key in self.pending:
+            plan = self.pending.pop(cache_key).get()
+            self.cache[cache_key] = plan
+        if plan is not None:
+            return plan
 
         options = []
 
-        subimg = self.subimage(sp)
-        current_similarity = costs.float_simil(subimg - current_color)
+        current_similarity = self.similarity_to_color(sp, current_color)
 
         # Leave as is.
-        options.append(Program(cmds=[], score=current_similarity))
+        options.append(Plan(kind="leave", score=current_similarity))
 
         color_cost = costs.get_cost(costs.COSTS.COLOR, sp.size)
         if current_similarity < color_cost:
             # any coloring at this level or deeper is too expensive
+            self.cache[cache_key] = options[0]
             return options[0]
 
         best_similarity = current_similarity
-
+        recolor = False
         if try_recolor:
             avg_color = self.get_geom_med_color(sp)
-            if avg_color != current_color:
-                # Recolor and stop here.
-                new_similarity = costs.float_simil(subimg - avg_color)
-                options.append(Program(
-                    cmds=[f"color [$] {avg_color}"],
-                    score=color_cost + new_similarity))
-
-                if depth < self.max_depth:
-                    # Recolor and try to improve the block again.
-                    o = self.improve(block_id="$", sp=sp,
-                                     current_color=avg_color, depth=depth+1,
-                                     try_recolor=False)  # not need to try to recolor again
-                    options.append(Program(
-                        cmds=[f"color [$] {avg_color}"] + o.cmds,
-                        score=color_cost + o.score))
-
-                best_similarity = min(current_similarity, new_similarity)
-
-        if depth < self.max_depth:  # TODO: review sizes
-            def improve_subshapes(cmd, cmd_cost, subshapes):
-                ops = [
-                    self.improve(
-                        sp=subshape, block_id=f"$.{i}", current_color=current_color, depth=depth+1)
-                    for i, subshape in enumerate(subshapes)
-                ]
-                subcmds = list(itertools.chain.from_iterable(
-                    [o.cmds for o in ops]))
-                subcmds_score = sum([o.score for o in ops])
-                return Program(cmds=[cmd] + subcmds, score=cmd_cost + subcmds_score)
-
-            # only try if we can recolor at least one of the new blocks (which are at least 2x smaller)
-            lin_split_cost = costs.get_cost(costs.COSTS.LINECUT, sp.size)
-            if best_similarity > color_cost * 2 + lin_split_cost:
-                # TODO: use an heurisic here, split top-level pics more, and lower level less
-                for ratio in self.get_x_splits(sp):
-                    x_pos = round(sp.x1 + sp.w * ratio)
-                    options.append(improve_subshapes(cmd=f"cut [$] [x] [{x_pos}]",
-                                                     cmd_cost=lin_split_cost,
-                                                     subshapes=sp.split_x(x_pos)))
-
-                for ratio in self.get_y_splits(sp):
-                    y_pos = round(sp.y1 + sp.h * ratio)
-                    options.append(improve_subshapes(cmd=f"cut [$] [y] [{y_pos}]",
-                                                     cmd_cost=lin_split_cost,
-                                                     subshapes=sp.split_y(y_pos)))
-
-            # only try if we can recolor at least one of the new blocks (which are at least 4x smaller)
-            pt_split_cost = costs.get_cost(costs.COSTS.POINTCUT, sp.size)
-            if best_similarity > color_cost * 4 + pt_split_cost:
-                for x_ratio, y_ratio in self.get_xy_splits(sp):
-                    x_pos = round(sp.x1 + sp.w * x_ratio)
-                    y_pos = round(sp.y1 + sp.h * y_ratio)
-                    options.append(improve_subshapes(cmd=f"cut [$] [{x_pos}, {y_pos}]",
-                                                     cmd_cost=pt_split_cost,
-                                                     subshapes=sp.split_xy(x_pos, y_pos)))
+            recolor = avg_color != current_color
+        if recolor:
+            new_similarity = self.similarity_to_color(sp, avg_color)
+            best_similarity = min(current_similarity, new_similarity)
+
+        splits = list(self.split_options(sp, best_similarity)) if depth < self.max_depth else []  # TODO: review sizes
+        # the children are solved in the pool, ahead of the loop below by up to `workers` cuts
+        dispatching = self.pool is not None and depth + 1 == self.parallel_depth
+        if dispatching and recolor:
+            self.dispatch(sp, avg_color, depth+1, try_recolor=False)
+
+        if recolor:
+            # Recolor and stop here.
+            options.append(Plan(kind="color", score=color_cost + new_similarity, color=avg_color))
+
+            if depth < self.max_depth:
+                if dispatching:
+                    self.dispatch_splits(splits[:self.workers], current_color, depth+1)
+                # Recolor and try to improve the block again.
+                plan = self.improve_plan(sp=sp, current_color=avg_color, depth=depth+1,
+                                         try_recolor=False)  # not need to try to recolor again
+                options.append(Plan(kind="color", score=color_cost + plan.score,
+                                    color=avg_color, children=(plan,)))
+
+        if depth < self.max_depth:
+            for i, (kind, position, cmd_cost, subshapes) in enumerate(splits):
+                if dispatching:
+                    self.dispatch_splits(splits[i:i + self.workers], current_color, depth+1)
+                plans = tuple(self.improve_plan(sp=subshape, current_color=current_color, depth=depth+1)
+                              for subshape in subshapes)
+                subcmds_score = sum([plan.score for plan in plans])
+                options.append(Plan(kind=kind, score=cmd_cost + subcmds_score, position=position, children=plans))
 
         if depth < 1:
             options_summary = "  \n".join(
-                [f"* Score: {o.score} Cmds: {str(o.cmds)[:50]}" for o in options])
-            print(f"OPTIONS FOR {block_id}:\n{options_summary}")
+                [f"* Score: {o.score} Cmds: {str(self.plan_cmds(o, '$'))[:50]}" for o in options])
+            print(f"OPTIONS FOR {sp}:\n{options_summary}")
 
         best_option = None
         for o in options:
@@ -372,9 +441,67 @@ class Solver:
                 best_option = o
 
         self.cache[cache_key] = best_option
+        return best_option
+
+    def split_options(self, sp: Shape, best_similarity):
+        """(kind, position, cost, subshapes) of the cuts worth trying on the block"""
+        color_cost = costs.get_cost(costs.COSTS.COLOR, sp.size)
 
-        return Program(cmds=[cmd.replace("$", block_id) for cmd in best_option.cmds],
-                       score=best_option.score)
+        # only try if we can recolor at least one of the new blocks (which are at least 2x smaller)
+        lin_split_cost = costs.get_cost(costs.COSTS.LINECUT, sp.size)
+        if best_similarity > color_cost * 2 + lin_split_cost:
+            # TODO: use an heurisic here, split top-level pics more, and lower level less
+            for ratio in self.get_x_splits(sp):
+                x_pos = round(sp.x1 + sp.w * ratio)
+                yield "cut_x", (x_pos,), lin_split_cost, sp.split_x(x_pos)
+
+            for ratio in self.get_y_splits(sp):
+                y_pos = round(sp.y1 + sp.h * ratio)
+                yield "cut_y", (y_pos,), lin_split_cost, sp.split_y(y_pos)
+
+        # only try if we can recolor at least one of the new blocks (which are at least 4x smaller)
+        pt_split_cost = costs.get_cost(costs.COSTS.POINTCUT, sp.size)
+        if best_similarity > color_cost * 4 + pt_split_cost:
+            for x_ratio, y_ratio in self.get_xy_splits(sp):
+                x_pos = round(sp.x1 + sp.w * x_ratio)
+                y_pos = round(sp.y1 + sp.h * y_ratio)
+                yield "cut_xy", (x_pos, y_pos), pt_split_cost, sp.split_xy(x_pos, y_pos)
+
+    def dispatch(self, sp: Shape, current_color, depth, try_recolor=True):
+        """Starts solving the block in the worker pool, improve_plan collects it"""
+        cache_key = self.plan_key(sp, current_color, depth, try_recolor)
+        if cache_key in self.pending or cache_key in self.cache:
+            return
+        subproblem = ((sp.x1, sp.y1, sp.x2, sp.y2), current_color, depth, try_recolor)
+        self.pending[cache_key] = self.pool.apply_async(worker_plan, (subproblem,))
+
+    def dispatch_splits(self, splits, current_color, depth):
+        """Dispatches the sub-blocks of the cuts, improve_plan solves all of them"""
+        for _, _, _, subshapes in splits:
+            for subshape in subshapes:
+                self.dispatch(subshape, current_color, depth)
+
+    @contextlib.contextmanager
+    def worker_pool(self):
+        """Pool of `workers` processes with their own solver, the image is shared
+        with them instead of pickled. Unfinished speculative tasks are dropped."""
+        shm = shared_memory.SharedMemory(create=True, size=self.ref_img.nbytes)
+        try:
+            img = np.ndarray(self.ref_img.shape, dtype=self.ref_img.dtype, buffer=shm.buf)
+            img[:] = self.ref_img
+            with multiprocessing.Pool(self.workers, initializer=init_worker,
+                                      initargs=(shm.name, img.shape, img.dtype, self.worker_args,
+                                                self.med_color_quad_tree is not None)) as pool:
+                self.pool = pool
+                try:
+                    yield pool
+                finally:
+                    self.pool = None
+                    self.pending = {}
+            del img
+        finally:
+            shm.close()
+            shm.unlink()
 
     def shuffle_initial_blocks(self) -> Program:
         def rounded_color(color):
@@ -408,10 +535,10 @@ class Solver:
             block = blocks_by_id[block_id]
             ideal_color = ideal_colors[block_id]
             subimg = self.subimage(block.shape)
-            old_similarity = costs.float_simil(subimg - block.color)
+            old_similarity = self.similarity_to_color(block.shape, block.color)
             swap_cost = costs.get_cost(costs.COSTS.SWAP, block.shape.size)
             color_cost = costs.get_cost(costs.COSTS.COLOR, block.shape.size)
-            ideal_similarity = costs.float_simil(subimg - ideal_color)
+            ideal_similarity = self.similarity_to_color(block.shape, ideal_color)
             just_recolor_score_delta = (color_cost + (ideal_similarity - old_similarity))
 
             if rounded_color(block.color) == ideal_color or old_similarity < swap_cost:
@@ -422,18 +549,15 @@ class Solver:
 
             # Try to find a match.
             has_swapped = False
-            matches = blocks_by_color.get(tuple(rounded_color(ideal_color)), [])
-            for other_block in matches:
-                if other_block.shape.size != block.shape.size:
-                    continue
-                if other_block.block_id == block_id or other_block.block_id in fixed_block_ids:
-                    continue
-
-                new_similarity = costs.float_simil(subimg - other_block.color)
-
+            matches = [other_block for other_block in blocks_by_color.get(tuple(rounded_color(ideal_color)), [])
+                       if other_block.shape.size == block.shape.size
+                       and other_block.block_id != block_id and other_block.block_id not in fixed_block_ids]
+            # this block against the colors of all the candidates at once
+            new_similarities = costs.float_simils(subimg, [other_block.color for other_block in matches])
+            for other_block, new_similarity in zip(matches, new_similarities):
                 other_subimg = self.subimage(other_block.shape)
-                old_similarity2 = costs.float_simil(other_subimg - other_block.color)
-                new_similarity2 = costs.float_simil(other_subimg - block.color)
+                old_similarity2, new_similarity2 = costs.float_simils(
+                    other_subimg, [other_block.color, block.color])
 
                 swap_score_delta = (swap_cost + (new_similarity - old_similarity) + (new_similarity2 - old_similarity2))
                 if swap_score_delta < 0 and swap_score_delta < just_recolor_score_delta:
@@ -459,10 +583,33 @@ class Solver:
         return Program(cmds=cmds, score=total_costs+similarities)
 
 
+# per worker process of Solver.worker_pool
+WORKER_SOLVER = None
+WORKER_SHM = None
+
+
+def init_worker(shm_name, shape, dtype, solver_args, use_pyramid):
+    global WORKER_SOLVER, WORKER_SHM
+    WORKER_SHM = shared_memory.SharedMemory(name=shm_name)
+    img = np.ndarray(shape, dtype=dtype, buffer=WORKER_SHM.buf)
+    WORKER_SOLVER = Solver(ref_img=img, **solver_args)
+    if use_pyramid:
+        WORKER_SOLVER.precompute_quad_tree(solver_args["problem_id"])
+
+
+def worker_plan(subproblem):
+    (x1, y1, x2, y2), color, depth, try_recolor = subproblem
+    return WORKER_SOLVER.improve_plan(Shape(x1, y1, x2, y2), color, depth, try_recolor)
+
+
 SOLUTIONS_DIR = "./solutions/binary_solver_dev"
+# budgets of Solver.cache and Solver.avg_color_cache in solve()
+CACHE_BYTES = 1 << 30
+COLOR_CACHE_BYTES = 256 << 20
 
 
-def solve(n):
+def solve(n, exact_colors=False, median_tolerance=None, cache_bytes=CACHE_BYTES, color_cache_bytes=COLOR_CACHE_BYTES,
+          workers=1, parallel_depth=1):
     img = open_as_np(n)
     if n >= 26:
         initial_json = read_initial_json(n)
@@ -475,11 +622,15 @@ def solve(n):
     start_time = time.time()
 
     solver = Solver(ref_img=img, max_depth=5,
-                    initial_blocks=initial_json.blocks)
+                    initial_blocks=initial_json.blocks, exact_colors=exact_colors,
+                    median_tolerance=median_tolerance, problem_id=n,
+                    cache_bytes=cache_bytes, color_cache_bytes=color_cache_bytes,
+                    workers=workers, parallel_depth=parallel_depth)
 
-    # solver.precompute_quad_tree()
-    # quad_tree_time = time.time()
-    # print(f"Time to quad tree: {quad_tree_time-start_time}")
+    if median_tolerance is not None:
+        solver.precompute_quad_tree(n)
+        quad_tree_time = time.time()
+        print(f"Time to quad tree: {quad_tree_time-start_time}")
 
     if n < 26:
         program = solver.improve("0", Shape(0, 0, 400, 400), [
@@ -490,14 +641,19 @@ def solve(n):
             program = Program(cmds = [f"color [{initial_json.blocks[0].block_id}] {initial_json.blocks[0].color}"], score=-1)
 
     end_time = time.time()
-    print(f"Solution: {program.score} (took {end_time-start_time}s, with {FAST_MED_COLOR_TIME + MED_COLOR_TIME} in get_med_color)")
+    print(f"Solution: {program.score} (took {end_time-start_time}s, with {FAST_MED_COLOR_TIME + MED_COLOR_TIME} in get_med_color, "
+          f"plan cache: {solver.cache.stats()}, color cache: {solver.avg_color_cache.stats()})")
     print("\n".join(program.cmds))
 
+    # exact score of the program, same as the optimizer jar would report
+    result = interpreter.score_program(img, program.cmds, interpreter.load_initial_state(n))
+    print(f"Local score: {result.total} (cost {result.cost}, similarity {result.similarity})")
+
     with open(f"{SOLUTIONS_DIR}/{n}.txt", "wt") as f:
         f.write("\n".join(program.cmds)+"\n")
 
     with open(f"{SOLUTIONS_DIR}/{n}.score", "wt") as f:
-        f.write(f"{program.score}")
+        f.write(f"{result.total}")
 
 
 def main():
@@ -0,0 +1,83 @@
+try:
+    import costs
+except ImportError:
+    import solver.costs as costs
+
+import numpy as np
+
+# Exact integer color search, the vectorized version of Canvas.findBestColor in
+# optimizer/src/main/java/solver/Main.java. A rounded geometric median is close
+# to the best color of a block but not always the best integer one; here every
+# value 0..255 of a channel is scored against all pixels in one broadcast pass,
+# and the channels are swept until none of them changes.
+
+VALUES = np.arange(256, dtype=np.float64)
+# bytes of the (pixels, 256) distance matrix scored at once
+CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def other_channels_sq(points, color, channel):
+    """Squared distance of every point to `color` over all the other channels"""
+    rest = np.delete(points, channel, 1) - np.delete(color, channel)
+    return np.einsum("ij,ij->i", rest, rest)
+
+
+def channel_totals(points, color, channel, weights=None, chunk_bytes=CHUNK_BYTES, values=VALUES):
+    """Sum of the (weighted) distances of `points` to `color` with the channel set
+    to each of `values` (0..255 by default)"""
+    rest_sq = other_channels_sq(points, color, channel)
+    totals = np.zeros(len(values))
+    rows = max(1, chunk_bytes // (len(values) * 8))
+    for start in range(0, len(points), rows):
+        d = points[start:start + rows, channel, None] - values
+        d *= d
+        d += rest_sq[start:start + rows, None]
+        np.sqrt(d, out=d)
+        if weights is None:
+            totals += d.sum(0)
+        else:
+            totals += weights[start:start + rows] @ d
+    return totals
+
+
+def channel_finalists(points, color, channel, sample_rate, z=3.0, rng=None):
+    """Values of the channel that may still be the best one, from a stratified
+    sample of the points"""
+    indices, sizes = costs.stratified_sample(len(points), sample_rate, rng)
+    sample = points[indices]
+    d = sample[:, channel, None] - VALUES
+    d *= d
+    d += other_channels_sq(sample, color, channel)[:, None]
+    np.sqrt(d, out=d)
+    return VALUES[costs.estimate_sums(d, sizes, z).finalists()]
+
+
+def best_color(points, color, weights=None, max_rounds=4, chunk_bytes=CHUNK_BYTES,
+               sample_rate=None, rng=None):
+    """Integer color with the lowest distance sum to `points` (k x channels pixels,
+    or distinct colors counted `weights` times), by coordinate descent from `color`.
+
+    With `sample_rate`, every value is first scored on that share of the pixels
+    and only the values whose confidence interval reaches the best one are scored
+    exactly (unweighted points only).
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)
+    color = [int(v) for v in color]
+    for _ in range(max_rounds):
+        changed = False
+        for channel in range(points.shape[1]):
+            values = VALUES
+            if sample_rate is not None and weights is None:
+                values = np.union1d(channel_finalists(points, color, channel, sample_rate, rng=rng),
+                                    [color[channel]])
+            totals = channel_totals(points, color, channel, weights, chunk_bytes, values)
+            best = int(np.argmin(totals))
+            current = int(np.searchsorted(values, color[channel]))
+            if totals[best] < totals[current]:
+                color[channel] = int(values[best])
+                changed = True
+        if not changed:
+            break
+    return color
@@ -1,12 +1,83 @@
+import dataclasses
+import math
+
 import numpy as np
 
+try:
+    import kernels
+except ImportError:
+    import solver.kernels as kernels
+
 def simil(a):
     """Usage: simil(orig_array-solution_array)"""
-    return round(np.linalg.norm(a, axis=(2)).sum()*0.005)
+    return round(kernels.norm_sum(a)*0.005)
 
 def float_simil(a):
     """Usage: simil(orig_array-solution_array)"""
-    return np.linalg.norm(a, axis=(2)).sum()*0.005
+    return kernels.norm_sum(a)*0.005
+
+def float_simil_between(a, b):
+    """float_simil(a - b) without the difference array when kernels are compiled,
+    b is an array of the same shape or a single color"""
+    return kernels.distance_sum(a, b)*0.005
+
+# bytes of the (pixels, colors, channels) difference array built at once
+SIMILS_CHUNK_BYTES = 16 * 1024 * 1024
+
+def float_simils(a, colors, chunk_bytes=SIMILS_CHUNK_BYTES):
+    """float_simil(a - color) for every row of `colors` (K x channels), in one pass
+    over `a` with bounded memory instead of a full temporary per color"""
+    pixels = np.asarray(a).reshape((-1, np.shape(a)[-1]))
+    colors = np.asarray(colors, dtype=np.float64).reshape((-1, pixels.shape[1]))
+    totals = np.zeros(len(colors))
+    rows = max(1, chunk_bytes // (max(colors.size, 1) * 8))
+    for start in range(0, len(pixels), rows):
+        d = pixels[start:start + rows, None, :] - colors
+        totals += np.sqrt(np.einsum("ikc,ikc->ik", d, d)).sum(0)
+    return totals * 0.005
+
+@dataclasses.dataclass
+class SimilEstimate:
+    """Estimated similarity (scalar or one per color) and the half width of its
+    confidence interval"""
+    value: np.ndarray
+    error: np.ndarray
+
+    @property
+    def low(self):
+        return self.value - self.error
+
+    @property
+    def high(self):
+        return self.value + self.error
+
+    def finalists(self):
+        """Indices of the colors that may still be the best one"""
+        return np.flatnonzero(self.low <= np.min(self.high))
+
+def stratified_sample(n, rate, rng=None):
+    """One random index out of every 1 / rate consecutive ones, and how many
+    indices each of them stands for"""
+    if not 0 < rate <= 1:
+        raise ValueError(f"sample rate {rate} is not in (0, 1]")
+    step = max(1, int(round(1 / rate)))
+    starts = np.arange(0, n, step)
+    sizes = np.minimum(step, n - starts)
+    rng = rng or np.random.default_rng()
+    return starts + (rng.random(len(starts)) * sizes).astype(np.int64), sizes
+
+def estimate_sums(d, sizes, z=3.0):
+    """SimilEstimate of the sums of distances from sampled distances d (m x K)"""
+    value = sizes @ d
+    if np.all(sizes == 1):
+        # every pixel was sampled
+        error = np.zeros_like(value)
+    elif len(d) < 2:
+        # no spread to go by, nothing can be ruled out
+        error = np.full_like(value, np.inf)
+    else:
+        error = z * np.sqrt(sizes @ sizes) * d.std(0, ddof=1)
+    return SimilEstimate(value=value * 0.005, error=error * 0.005)
 
 class COSTS:
     LINECUT=7
@@ -15,6 +86,15 @@ class COSTS:
     SWAP=3
     MERGE=1
 
+class COSTS_V2(COSTS):
+    """Adjusted base costs of the problems that start from a source png (36+)"""
+    LINECUT=2
+    POINTCUT=3
+
+def server_round(v):
+    """Math.round() as used by the contest server and optimizer/Main.java: halves go up"""
+    return math.floor(v + 0.5)
+
 def get_cost(move: COSTS, block_size: int):
     canvas_size = 400 * 400
     return round(move * float(canvas_size)/block_size)
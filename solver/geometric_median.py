@@ -3,23 +3,56 @@
 import numpy as np
 from scipy.spatial.distance import cdist, euclidean
 
+try:
+    import kernels
+except ImportError:
+    import solver.kernels as kernels
+
 # See https://stackoverflow.com/questions/30299267/geometric-median-of-multidimensional-points
-def geometric_median(X, eps=1e-0):
-    y = np.mean(X, 0)
+def geometric_median(X, eps=1e-0, weights=None):
+    """`weights` count each point that many times (e.g. unique colors of a histogram)"""
+    if kernels.JIT:
+        return jit_geometric_median(X, eps, weights)
+    return numpy_geometric_median(X, eps, weights)
+
+
+def jit_geometric_median(X, eps=1e-0, weights=None):
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    if weights is None:
+        w = np.ones(len(X))
+        y = np.mean(X, 0)
+    else:
+        w = np.asarray(weights, dtype=np.float64)
+        y = np.average(X, axis=0, weights=w)
+    return kernels.weiszfeld(X, w, y, eps, 1 << 30)
+
+
+def numpy_geometric_median(X, eps=1e-0, weights=None):
+    if weights is None:
+        y = np.mean(X, 0)
+        total = len(X)
+    else:
+        weights = np.asarray(weights, dtype=np.float64)
+        y = np.average(X, axis=0, weights=weights)
+        total = np.sum(weights)
 
     while True:
         D = cdist(X, [y])
         nonzeros = (D != 0)[:, 0]
 
-        Dinv = 1 / D[nonzeros]
+        if weights is None:
+            Dinv = 1 / D[nonzeros]
+            num_zeros = len(X) - np.sum(nonzeros)
+        else:
+            Dinv = weights[nonzeros, None] / D[nonzeros]
+            num_zeros = np.sum(weights[~nonzeros])
         Dinvs = np.sum(Dinv)
         W = Dinv / Dinvs
         T = np.sum(W * X[nonzeros], 0)
 
-        num_zeros = len(X) - np.sum(nonzeros)
         if num_zeros == 0:
             y1 = T
-        elif num_zeros == len(X):
+        elif num_zeros == total:
             return y
         else:
             R = (T - y) * Dinvs
@@ -30,4 +63,130 @@ def geometric_median(X, eps=1e-0):
         if euclidean(y, y1) < eps:
             return y1
 
-        y = y1
\ No newline at end of file
+        y = y1
+
+
+def fast_geometric_median(X, eps=1e-0, weights=None, init=None, max_iter=100):
+    """Weiszfeld iteration like geometric_median, bounded by `max_iter`.
+
+    Runs in float32 on buffers allocated once per call instead of per iteration.
+    `weights` count points like in geometric_median and `init` starts from a
+    known point (e.g. the median of the parent block) when it is closer to the
+    points than their mean.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    k, d = X.shape
+    if weights is None:
+        w = np.ones(k, dtype=np.float32)
+    else:
+        w = np.asarray(weights, dtype=np.float32)
+    total = w.sum()
+    y = (w @ X) / total
+
+    diff = np.empty((k, d), dtype=np.float32)
+    D = np.empty(k, dtype=np.float32)
+    zeros = np.empty(k, dtype=bool)
+    Dinv = np.empty(k, dtype=np.float32)
+
+    def distance_sum(point):
+        np.subtract(X, point, out=diff)
+        np.einsum("ij,ij->i", diff, diff, out=D)
+        return w @ np.sqrt(D, out=D)
+
+    # Weiszfeld crawls next to a dense cluster of points, so a warm start that
+    # is worse than the mean (e.g. the parent's background color) is dropped
+    if init is not None:
+        init = np.asarray(init, dtype=np.float32)
+        if distance_sum(init) < distance_sum(y):
+            y = init
+
+    if kernels.JIT:
+        return kernels.weiszfeld(X, w, y.astype(np.float64), eps, max_iter)
+
+    for _ in range(max_iter):
+        np.subtract(X, y, out=diff)
+        np.einsum("ij,ij->i", diff, diff, out=D)
+        np.sqrt(D, out=D)
+        np.equal(D, 0, out=zeros)
+        num_zeros = w @ zeros
+        if num_zeros == total:
+            break
+        np.copyto(D, np.inf, where=zeros)
+        np.divide(w, D, out=Dinv)
+        Dinvs = Dinv.sum()
+        T = (Dinv @ X) / Dinvs
+
+        if num_zeros == 0:
+            y1 = T
+        else:
+            r = np.linalg.norm((T - y) * Dinvs)
+            rinv = 0 if r == 0 else num_zeros / r
+            y1 = max(0, 1 - rinv) * T + min(1, rinv) * y
+
+        step = np.linalg.norm(y - y1)
+        y = y1
+        if step < eps:
+            break
+
+    return y.astype(np.float64)
+
+
+def geometric_median_batch(X, eps=1e-0, weights=None):
+    """Geometric medians of N point sets of the same size at once, X is (N, k, d).
+
+    Same iteration as geometric_median, run on all sets together; a set stops
+    updating as soon as it converged. `weights` (N, k) can be 0 to pad sets
+    that have fewer points.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    if weights is None:
+        weights = np.ones(X.shape[:2])
+        y = X.mean(1)
+    else:
+        weights = np.asarray(weights, dtype=np.float64)
+        y = np.einsum("nk,nkd->nd", weights, X) / weights.sum(1)[:, None]
+    totals = weights.sum(1)
+    medians = y.copy()
+    active = np.arange(len(X))
+
+    while len(active):
+        Xa, wa, ya = X[active], weights[active], y[active]
+        D = np.sqrt(((Xa - ya[:, None, :]) ** 2).sum(-1))
+        nonzeros = D != 0
+
+        Dinv = np.where(nonzeros, wa / np.where(nonzeros, D, 1), 0)
+        Dinvs = Dinv.sum(1)
+        W = Dinv / np.where(Dinvs == 0, 1, Dinvs)[:, None]
+        T = (W[:, :, None] * Xa).sum(1)
+
+        num_zeros = np.where(nonzeros, 0, wa).sum(1)
+        R = (T - ya) * Dinvs[:, None]
+        r = np.linalg.norm(R, axis=1)
+        rinv = np.where(r == 0, 0, num_zeros / np.where(r == 0, 1, r))[:, None]
+        y1 = np.where((num_zeros == 0)[:, None], T,
+                      np.maximum(0, 1 - rinv) * T + np.minimum(1, rinv) * ya)
+
+        all_zeros = num_zeros == totals[active]
+        converged = np.sqrt(((ya - y1) ** 2).sum(1)) < eps
+        medians[active[all_zeros]] = ya[all_zeros]
+        done = converged & ~all_zeros
+        medians[active[done]] = y1[done]
+        y[active] = y1
+        active = active[~(all_zeros | converged)]
+
+    return medians
+
+
+def tile_medians(tiles, eps=1e-0):
+    """Geometric medians of a list of [w, h, channels] image tiles, solved in one
+    batch per tile shape"""
+    by_shape = {}
+    for i, tile in enumerate(tiles):
+        by_shape.setdefault(tile.shape, []).append(i)
+
+    medians = [None] * len(tiles)
+    for (w, h, channels), indices in by_shape.items():
+        stack = np.stack([tiles[i].reshape(w * h, channels) for i in indices])
+        for i, median in zip(indices, geometric_median_batch(stack, eps=eps)):
+            medians[i] = median
+    return medians
@@ -0,0 +1,117 @@
+import collections
+
+import numpy as np
+
+# Summed-area tables of a [x, y, rgba] image: any rectangle's channel sums, mean
+# and variance (IntegralImage) or its distance to a fixed color
+# (ColorDistanceTables) in O(1). Rectangles are [x1, x2) x [y1, y2).
+
+
+class IntegralImage:
+    """Coordinates may also be numpy arrays to query many rectangles at once"""
+
+    def __init__(self, img):
+        img = np.asarray(img, dtype=np.int64)
+        w, h, channels = img.shape
+        self.sums = np.zeros((w + 1, h + 1, channels), dtype=np.int64)
+        self.sums[1:, 1:] = img.cumsum(0).cumsum(1)
+        self.sq_sums = np.zeros((w + 1, h + 1, channels), dtype=np.int64)
+        self.sq_sums[1:, 1:] = (img * img).cumsum(0).cumsum(1)
+
+    @staticmethod
+    def _rect(table, x1, y1, x2, y2):
+        return table[x2, y2] - table[x1, y2] - table[x2, y1] + table[x1, y1]
+
+    def size(self, x1, y1, x2, y2):
+        return np.multiply(np.subtract(x2, x1), np.subtract(y2, y1))
+
+    def sum(self, x1, y1, x2, y2):
+        """Per channel sum of the pixels"""
+        return self._rect(self.sums, x1, y1, x2, y2)
+
+    def sq_sum(self, x1, y1, x2, y2):
+        """Per channel sum of the squared pixels"""
+        return self._rect(self.sq_sums, x1, y1, x2, y2)
+
+    def mean(self, x1, y1, x2, y2):
+        n = self.size(x1, y1, x2, y2)
+        return self.sum(x1, y1, x2, y2) / np.expand_dims(n, -1)
+
+    def variance(self, x1, y1, x2, y2):
+        """Per channel variance of the pixels"""
+        n = np.expand_dims(self.size(x1, y1, x2, y2), -1)
+        mean = self.sum(x1, y1, x2, y2) / n
+        return self.sq_sum(x1, y1, x2, y2) / n - mean * mean
+
+    def sq_dist_sum(self, x1, y1, x2, y2, color):
+        """Sum of the squared euclidean distances of the pixels to `color`"""
+        color = np.asarray(color, dtype=np.float64)
+        n = self.size(x1, y1, x2, y2)
+        return (self.sq_sum(x1, y1, x2, y2).sum(-1)
+                - 2 * (self.sum(x1, y1, x2, y2) * color).sum(-1)
+                + n * (color * color).sum(-1))
+
+
+# fixed point unit of ColorDistanceTables: a 400x400 image of distances up to 510
+# still sums below 2^63, and each pixel is rounded by at most 2^-33
+DIST_SCALE = 2 ** 32
+
+
+class ColorDistanceTables:
+    """Prefix sums of |pixel - color| for fixed colors, so the similarity of
+    any rectangle to a color is O(1) once the color's table is built.
+
+    Tables cover only the region they were requested for (grown to the bounding
+    box of later requests), since a color is mostly scored on one block and
+    its sub-blocks. Least recently used tables are dropped above `max_bytes`.
+
+    Distances are summed in fixed point (DIST_SCALE units) so the sums are
+    exact: a rectangle gets the same value whatever region its table covers,
+    i.e. whatever was scored before, which keeps solver runs reproducible.
+    """
+
+    def __init__(self, img, max_bytes=64 * 1024 * 1024):
+        self.img = np.asarray(img, dtype=np.int64)
+        self.max_bytes = max_bytes
+        self.tables = collections.OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _build(self, color, x1, y1, x2, y2):
+        d = self.img[x1:x2, y1:y2] - np.asarray(color)
+        table = np.zeros((x2 - x1 + 1, y2 - y1 + 1), dtype=np.int64)
+        dist = np.rint(np.sqrt(np.einsum("ijk,ijk->ij", d, d)) * DIST_SCALE).astype(np.int64)
+        table[1:, 1:] = dist.cumsum(0).cumsum(1)
+        return (x1, y1, x2, y2), table
+
+    def _table(self, color, x1, y1, x2, y2):
+        key = tuple(color)
+        entry = self.tables.get(key)
+        if entry is not None:
+            (rx1, ry1, rx2, ry2), table = entry
+            if rx1 <= x1 and ry1 <= y1 and x2 <= rx2 and y2 <= ry2:
+                self.hits += 1
+                self.tables.move_to_end(key)
+                return entry
+            x1, y1, x2, y2 = min(x1, rx1), min(y1, ry1), max(x2, rx2), max(y2, ry2)
+            self.nbytes -= table.nbytes
+            del self.tables[key]
+        self.misses += 1
+        entry = self._build(key, x1, y1, x2, y2)
+        self.tables[key] = entry
+        self.nbytes += entry[1].nbytes
+        while self.nbytes > self.max_bytes and len(self.tables) > 1:
+            _, (_, dropped) = self.tables.popitem(last=False)
+            self.nbytes -= dropped.nbytes
+        return entry
+
+    def dist_sum(self, color, x1, y1, x2, y2):
+        """Sum of the euclidean distances of the pixels of a rectangle to `color`"""
+        (rx1, ry1, _, _), t = self._table(color, x1, y1, x2, y2)
+        x1, y1, x2, y2 = x1 - rx1, y1 - ry1, x2 - rx1, y2 - ry1
+        return int(t[x2, y2] - t[x1, y2] - t[x2, y1] + t[x1, y1]) / DIST_SCALE
+
+    def float_simil(self, color, x1, y1, x2, y2):
+        """Same as costs.float_simil(img[x1:x2, y1:y2] - color)"""
+        return self.dist_sum(color, x1, y1, x2, y2) * 0.005
@@ -0,0 +1,817 @@
+try:
+    import costs
+except ImportError:
+    import solver.costs as costs
+
+import ast
+import dataclasses
+import json
+import os
+import sys
+import typing
+
+import numpy as np
+from PIL import Image
+
+## Usage:
+## python3 -m solver.interpreter <solution.txt> <problem id>
+## python3 -m solver.interpreter --check <solution.txt> <problem id>   (validity only, no pixels)
+##
+## Executes ISL programs in-process and scores them exactly like
+## optimizer/src/main/java/solver/Main.java (`test`).
+
+PROBLEMS_DIR = "./problems"
+# where the source pngs of problems 36+ are looked up, see source_png_path
+SOURCE_PNG_DIR = os.environ.get("SOURCE_PNG_DIR", PROBLEMS_DIR)
+CANVAS_SIZE = 400
+WHITE = (255, 255, 255, 255)
+
+# default memory budget for CheckpointedRun snapshots (one canvas is 640KB)
+CHECKPOINTS_MAX_BYTES = 64 * 1024 * 1024
+# side of the tiles SimilarityTiles keeps running totals for
+TILE_SIZE = 20
+
+
+class InvalidMove(Exception):
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+        self.message = message
+
+
+@dataclasses.dataclass
+class Move:
+    """One ISL instruction. `kind` is one of the costs.COSTS names."""
+    kind: str
+    blocks: typing.Tuple[str, ...]
+    args: typing.Tuple = ()
+    line: int = 0
+
+    def __str__(self):
+        if self.kind == "COLOR":
+            return f"color [{self.blocks[0]}] {list(self.args)}"
+        if self.kind == "LINECUT":
+            return f"cut [{self.blocks[0]}] [{self.args[0]}] [{self.args[1]}]"
+        if self.kind == "POINTCUT":
+            return f"cut [{self.blocks[0]}] [{self.args[0]}, {self.args[1]}]"
+        return f"{self.kind.lower()} [{self.blocks[0]}] [{self.blocks[1]}]"
+
+
+@dataclasses.dataclass
+class Score:
+    cost: int
+    similarity: int
+
+    @property
+    def total(self):
+        return self.cost + self.similarity
+
+
+@dataclasses.dataclass
+class InitialBlock:
+    block_id: str
+    x1: int
+    y1: int
+    x2: int
+    y2: int
+    color: typing.Optional[typing.Tuple[int, int, int, int]] = None
+    png_point: typing.Optional[typing.Tuple[int, int]] = None
+
+
+@dataclasses.dataclass
+class InitialState:
+    width: int
+    height: int
+    blocks: typing.List[InitialBlock]
+    canvas: np.ndarray
+    base_costs: type = costs.COSTS
+
+    @staticmethod
+    def blank():
+        canvas = np.empty((CANVAS_SIZE, CANVAS_SIZE, 4), dtype=np.uint8)
+        canvas[:, :] = WHITE
+        return InitialState(
+            width=CANVAS_SIZE, height=CANVAS_SIZE,
+            blocks=[InitialBlock("0", 0, 0, CANVAS_SIZE, CANVAS_SIZE, color=WHITE)],
+            canvas=canvas)
+
+
+def open_png_as_np(path):
+    a = np.asarray(Image.open(path))
+    return a[::-1, :].swapaxes(0, 1)
+
+
+def open_as_np(n, suffix=""):
+    return open_png_as_np(f"{PROBLEMS_DIR}/{n}{suffix}.png")
+
+
+def source_png_path(n, json_obj):
+    """Source png of problems 36+, named like the sourcePngPNG url in SOURCE_PNG_DIR,
+    or the local copy problems/<n>.initial.png"""
+    name = os.path.basename(json_obj.get("sourcePngPNG", ""))
+    path = os.path.join(SOURCE_PNG_DIR, name)
+    if not name or not os.path.exists(path):
+        path = f"{PROBLEMS_DIR}/{n}.initial.png"
+    return path
+
+
+def block_labels(width, height, blocks: typing.List[InitialBlock]):
+    """[x, y] index of the block covering each pixel (-1 if none).
+
+    Blocks are disjoint, so adding +-(index + 1) at the corners of every block
+    and taking prefix sums along both axes paints all of them at once.
+    """
+    corners = np.zeros((width + 1, height + 1), dtype=np.int32)
+    r = np.array([(b.x1, b.y1, b.x2, b.y2) for b in blocks], dtype=np.int32).reshape(-1, 4)
+    ids = np.arange(1, len(blocks) + 1, dtype=np.int32)
+    np.add.at(corners, (r[:, 0], r[:, 1]), ids)
+    np.add.at(corners, (r[:, 2], r[:, 1]), -ids)
+    np.add.at(corners, (r[:, 0], r[:, 3]), -ids)
+    np.add.at(corners, (r[:, 2], r[:, 3]), ids)
+    return corners.cumsum(0).cumsum(1)[:width, :height] - 1
+
+
+def render_initial_canvas(width, height, blocks: typing.List[InitialBlock], source=None):
+    """Canvas of the initial blocks: plain colors, or pixels of `source` for png blocks"""
+    labels = block_labels(width, height, blocks)
+    colors = np.array([b.color or (0, 0, 0, 0) for b in blocks] + [(0, 0, 0, 0)], dtype=np.uint8)
+    canvas = colors[labels]
+    png_blocks = np.array([b.png_point is not None for b in blocks] + [False])
+    if png_blocks.any():
+        shift = np.array([(b.png_point[0] - b.x1, b.png_point[1] - b.y1) if b.png_point else (0, 0)
+                          for b in blocks] + [(0, 0)], dtype=np.int32)
+        xs, ys = np.nonzero(png_blocks[labels])
+        owner = labels[xs, ys]
+        canvas[xs, ys] = source[xs + shift[owner, 0], ys + shift[owner, 1]]
+    return canvas
+
+
+def load_initial_canvas(n, json_obj, blocks: typing.List[InitialBlock]):
+    """Rendered initial canvas of problem n, cached as problems/<n>.initial.npy
+    until the json or the source png changes"""
+    path = f"{PROBLEMS_DIR}/{n}.initial.npy"
+    inputs = [f"{PROBLEMS_DIR}/{n}.initial.json"]
+    has_png = any(b.png_point is not None for b in blocks)
+    if has_png:
+        inputs.append(source_png_path(n, json_obj))
+    if os.path.exists(path) and all(os.path.getmtime(path) >= os.path.getmtime(p) for p in inputs):
+        return np.load(path)
+
+    source = None
+    if has_png:
+        source = open_png_as_np(inputs[1])
+    canvas = render_initial_canvas(json_obj["width"], json_obj["height"], blocks, source)
+    # written aside and renamed, so other processes never load a partial file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, canvas)
+    os.replace(tmp, path)
+    return canvas
+
+
+def load_initial_state(n) -> InitialState:
+    """Initial blocks and canvas of problem n (a blank white canvas if it has no initial json)"""
+    path = f"{PROBLEMS_DIR}/{n}.initial.json"
+    if not os.path.exists(path):
+        return InitialState.blank()
+
+    with open(path, "rt") as f:
+        json_obj = json.load(f)
+
+    blocks = [
+        InitialBlock(
+            block_id=b["blockId"],
+            x1=b["bottomLeft"][0], y1=b["bottomLeft"][1],
+            x2=b["topRight"][0], y2=b["topRight"][1],
+            color=tuple(b["color"]) if "color" in b else None,
+            png_point=tuple(b["pngBottomLeftPoint"]) if "pngBottomLeftPoint" in b else None)
+        for b in json_obj["blocks"]]
+    base_costs = costs.COSTS_V2 if "sourcePngPNG" in json_obj else costs.COSTS
+    return InitialState(width=json_obj["width"], height=json_obj["height"], blocks=blocks,
+                        canvas=load_initial_canvas(n, json_obj, blocks), base_costs=base_costs)
+
+
+def decode_program(text: str) -> str:
+    """Some downloaded solutions are stored as the repr of a bytes object"""
+    stripped = text.strip()
+    if stripped.startswith("b'") or stripped.startswith('b"'):
+        return ast.literal_eval(stripped).decode()
+    return text
+
+
+def check_coordinates(values, line_no):
+    for v in values:
+        if not 0 <= v <= P_MAX:
+            raise InvalidMove(line_no, f"coordinate {v} is out of range")
+
+
+def parse_move(line: str, line_no: int = 0) -> Move:
+    compact = line.replace(" ", "")
+    name, *parts = compact.split("[")
+    parts = [p.replace("]", "") for p in parts]
+    try:
+        if name == "color":
+            color = tuple(int(v) for v in parts[1].split(","))
+            if len(color) != 4:
+                raise ValueError(f"color must have 4 components: {parts[1]}")
+            for v in color:
+                if not 0 <= v <= 255:
+                    raise InvalidMove(line_no, f"color component {v} is outside 0..255")
+            return Move("COLOR", (parts[0],), color, line_no)
+        if name == "cut" and len(parts) == 3:
+            orientation = parts[1].lower()
+            if orientation not in ("x", "y"):
+                raise ValueError(f"unknown orientation {parts[1]}")
+            offset = int(parts[2])
+            check_coordinates([offset], line_no)
+            return Move("LINECUT", (parts[0],), (orientation, offset), line_no)
+        if name == "cut" and len(parts) == 2:
+            x, y = (int(v) for v in parts[1].split(","))
+            check_coordinates([x, y], line_no)
+            return Move("POINTCUT", (parts[0],), (x, y), line_no)
+        if name in ("swap", "merge") and len(parts) == 2:
+            return Move(name.upper(), (parts[0], parts[1]), (), line_no)
+    except (ValueError, IndexError) as err:
+        raise InvalidMove(line_no, f"cannot parse '{line}': {err}")
+    raise InvalidMove(line_no, f"unknown move '{line}'")
+
+
+def parse_program(text: str, errors: typing.List[InvalidMove] = None) -> typing.List[Move]:
+    """Moves of a program. With an `errors` list, lines that cannot be parsed are
+    appended to it and skipped instead of raising."""
+    moves = []
+    for i, line in enumerate(decode_program(text).split("\n")):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            moves.append(parse_move(line, i + 1))
+        except InvalidMove as err:
+            if errors is None:
+                raise
+            errors.append(err)
+    return moves
+
+
+def load_program(path) -> typing.List[Move]:
+    with open(path, "rt") as f:
+        return parse_program(f.read())
+
+
+def pixel_dist(a, b):
+    """Per-pixel euclidean distance between two [x, y, 4] arrays"""
+    d = np.subtract(a, b, dtype=np.int32)
+    return np.sqrt(np.einsum("ijk,ijk->ij", d, d))
+
+
+class SimilarityTiles:
+    """Running similarity between a canvas and the target.
+
+    Keeps per-tile totals of the pixel distance. Painting a rectangle only
+    marks its tiles dirty, and scoring re-computes just the dirty tiles, so a
+    move costs O(changed area) instead of O(canvas). The canvas array is
+    shared with the owner and must be changed through paint() / update().
+    """
+
+    def __init__(self, target, canvas, tile=TILE_SIZE):
+        self.target = target
+        self.canvas = canvas
+        self.tile = tile
+        w, h = canvas.shape[:2]
+        self.tiles = np.zeros((-(-w // tile), -(-h // tile)))
+        self.dirty = np.ones(self.tiles.shape, dtype=bool)
+        # filling rgba bytes as one uint32 per pixel is much faster than broadcasting 4 channels
+        self.packed = None
+        if canvas.dtype == np.uint8 and canvas.flags.c_contiguous:
+            self.packed = canvas.view(np.uint32)[:, :, 0]
+
+    def paint(self, x1, y1, x2, y2, color):
+        if self.packed is not None:
+            self.packed[x1:x2, y1:y2] = np.array(color, dtype=np.uint8).view(np.uint32)[0]
+        else:
+            self.canvas[x1:x2, y1:y2] = color
+        self.update(x1, y1, x2, y2)
+
+    def update(self, x1, y1, x2, y2):
+        """Marks canvas[x1:x2, y1:y2] as changed"""
+        t = self.tile
+        self.dirty[x1 // t:-(-x2 // t), y1 // t:-(-y2 // t)] = True
+
+    def flush(self):
+        """Re-scores the dirty tiles, one span of tile columns at a time"""
+        t = self.tile
+        for tx in np.flatnonzero(self.dirty.any(axis=1)):
+            ys = np.flatnonzero(self.dirty[tx])
+            ty1, ty2 = ys[0], ys[-1] + 1
+            box = (slice(tx * t, (tx + 1) * t), slice(ty1 * t, ty2 * t))
+            dist = pixel_dist(self.canvas[box], self.target[box]).sum(axis=0)
+            self.tiles[tx, ty1:ty2] = np.add.reduceat(dist, np.arange(0, len(dist), t))
+            self.dirty[tx, ty1:ty2] = False
+
+    def total(self):
+        """Unscaled sum of the pixel distances"""
+        self.flush()
+        return self.tiles.sum()
+
+    def similarity(self):
+        return costs.server_round(self.total() * 0.005)
+
+    def snapshot(self):
+        return (self.tiles.copy(), self.dirty.copy())
+
+    def restore(self, snapshot):
+        np.copyto(self.tiles, snapshot[0])
+        np.copyto(self.dirty, snapshot[1])
+
+
+# compiled moves: opcode (index in OPCODES), block nodes a and b, first new node c
+# (cut children or merge result), integer params p and the source line.
+# p is the color, [0 for x / 1 for y, offset, 0, 0] for line cuts, [x, y, 0, 0] for point cuts
+OPCODES = ["COLOR", "LINECUT", "POINTCUT", "SWAP", "MERGE"]
+OP_COLOR, OP_LINECUT, OP_POINTCUT, OP_SWAP, OP_MERGE = range(len(OPCODES))
+OP_DTYPE = np.dtype([("op", "u1"), ("a", "i4"), ("b", "i4"), ("c", "i4"),
+                     ("p", "i4", (4,)), ("line", "i4")])
+P_MIN, P_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+
+def encode_params(move: Move):
+    if move.kind == "COLOR":
+        params = list(move.args)
+    elif move.kind == "LINECUT":
+        params = [0 if move.args[0] == "x" else 1, move.args[1], 0, 0]
+    elif move.kind == "POINTCUT":
+        params = [move.args[0], move.args[1], 0, 0]
+    else:
+        params = [0, 0, 0, 0]
+    for v in params:
+        if not P_MIN <= v <= P_MAX:
+            # outside any canvas, and it would not fit the compiled move
+            raise InvalidMove(move.line, f"value {v} of '{move}' is out of range")
+    return params
+
+
+class BlockTable:
+    """Blocks as rows ("nodes") of numpy columns: geometry x, y, w, h, the
+    parent node, the first child node and number of children, and whether the
+    block currently exists.
+
+    Block ids are interned into nodes when moves are compiled. Cut children get
+    consecutive nodes, so "538.1.1.0" is resolved once through its parents and
+    cached; executing a compiled move only does integer work.
+    """
+
+    def __init__(self, initial: InitialState, capacity=256):
+        self.initial = initial
+        self.size = 0
+        self.geom = np.zeros((capacity, 4), dtype=np.int32)
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.children = np.full(capacity, -1, dtype=np.int32)
+        self.nchildren = np.zeros(capacity, dtype=np.int8)
+        self.alive = np.zeros(capacity, dtype=bool)
+        ids = [b.block_id for b in initial.blocks]
+        self.initial_geom = np.array([(b.x1, b.y1, b.x2 - b.x1, b.y2 - b.y1) for b in initial.blocks],
+                                     dtype=np.int32).reshape(-1, 4)
+        self.add_nodes(len(ids))
+        self.nodes = dict(zip(ids, range(len(ids))))
+        self.root_names = dict(enumerate(ids))
+        self.counter = len(ids) - 1
+        self.reset()
+
+    @staticmethod
+    def from_ops(initial: InitialState, ops: np.ndarray) -> "BlockTable":
+        """Rebuilds the table of a compiled program without parsing any block id.
+
+        Only works for programs that never reference an unknown id (see `unknown`).
+        """
+        n_initial = len(initial.blocks)
+        codes = ops["op"]
+        cuts = ops[(codes == OP_LINECUT) | (codes == OP_POINTCUT)]
+        merges = ops["c"][codes == OP_MERGE]
+        counts = np.where(cuts["op"] == OP_LINECUT, 2, 4)
+        size = n_initial + int(counts.sum()) + len(merges)
+
+        table = BlockTable(initial, capacity=max(size, 1))
+        table.size = size
+        table.children[cuts["a"]] = cuts["c"]
+        table.nchildren[cuts["a"]] = counts
+        starts = np.repeat(cuts["c"], counts)
+        offsets = np.arange(len(starts)) - np.repeat(np.cumsum(counts) - counts, counts)
+        table.parent[starts + offsets] = np.repeat(cuts["a"], counts)
+        names = [str(i) for i in range(n_initial, n_initial + len(merges))]
+        table.nodes.update(zip(names, merges.tolist()))
+        table.root_names.update(zip(merges.tolist(), names))
+        table.counter += len(merges)
+        return table
+
+    @property
+    def unknown(self):
+        """Number of nodes created for ids that did not exist when they were referenced"""
+        return len(self.root_names) - (self.counter + 1)
+
+    @property
+    def x(self):
+        return self.geom[:self.size, 0]
+
+    @property
+    def y(self):
+        return self.geom[:self.size, 1]
+
+    @property
+    def w(self):
+        return self.geom[:self.size, 2]
+
+    @property
+    def h(self):
+        return self.geom[:self.size, 3]
+
+    def reset(self):
+        """Back to the initial blocks"""
+        n = len(self.initial_geom)
+        self.alive[:] = False
+        self.alive[:n] = True
+        self.geom[:n] = self.initial_geom
+
+    def state(self):
+        return (self.geom[:self.size].copy(), self.alive[:self.size].copy())
+
+    def set_state(self, state):
+        geom, alive = state
+        self.geom[:len(geom)] = geom
+        self.alive[:len(alive)] = alive
+        self.alive[len(alive):] = False
+
+    def add_nodes(self, count, parent=-1):
+        first = self.size
+        self.size += count
+        if self.size > len(self.parent):
+            capacity = max(self.size, 2 * len(self.parent))
+            for name, fill in [("geom", 0), ("parent", -1), ("children", -1), ("nchildren", 0), ("alive", False)]:
+                column = getattr(self, name)
+                grown = np.full((capacity,) + column.shape[1:], fill, dtype=column.dtype)
+                grown[:len(column)] = column
+                setattr(self, name, grown)
+        self.parent[first:self.size] = parent
+        return first
+
+    def add_root(self, block_id):
+        node = self.add_nodes(1)
+        self.nodes[block_id] = node
+        self.root_names[node] = block_id
+        return node
+
+    def intern(self, block_id) -> int:
+        """Node of block_id. An id that does not exist (yet) gets a fresh node that is never alive."""
+        node = self.nodes.get(block_id)
+        if node is None:
+            node = self._resolve_child(block_id)
+            if node is None:
+                node = self.add_nodes(1)
+                self.root_names[node] = block_id
+            else:
+                self.nodes[block_id] = node
+        return node
+
+    def _resolve_child(self, block_id):
+        parent_id, _, index = block_id.rpartition(".")
+        if not parent_id or not index.isdigit():
+            return None
+        parent = self.nodes.get(parent_id)
+        if parent is None:
+            parent = self._resolve_child(parent_id)
+            if parent is None:
+                return None
+            self.nodes[parent_id] = parent
+        if int(index) >= self.nchildren[parent]:
+            return None
+        return int(self.children[parent]) + int(index)
+
+    def name(self, node) -> str:
+        if node in self.root_names:
+            return self.root_names[node]
+        parent = int(self.parent[node])
+        return f"{self.name(parent)}.{node - self.children[parent]}"
+
+    def compile(self, move: Move):
+        """Interns the blocks of a move, allocating nodes for the blocks it creates"""
+        op = OPCODES.index(move.kind)
+        a = self.intern(move.blocks[0])
+        b = self.intern(move.blocks[1]) if len(move.blocks) > 1 else -1
+        c = -1
+        if op == OP_LINECUT or op == OP_POINTCUT:
+            count = 2 if op == OP_LINECUT else 4
+            c = self.add_nodes(count, parent=a)
+            self.children[a] = c
+            self.nchildren[a] = count
+        elif op == OP_MERGE:
+            self.counter += 1
+            c = self.add_root(str(self.counter))
+        return (op, a, b, c, encode_params(move), move.line)
+
+    def execute(self, op) -> int:
+        """Validates a compiled move and applies it to the block geometry only.
+
+        Returns the block size its cost is based on. Pixels are the job of the
+        Interpreter, which calls this first.
+        """
+        code, a, b, c, p, line = op
+        if not self.alive[a]:
+            raise InvalidMove(line, f"unknown block [{self.name(a)}]")
+        x, y, w, h = self.geom[a].tolist()
+
+        if code == OP_COLOR:
+            if not all(0 <= v <= 255 for v in p):
+                raise InvalidMove(line, f"color [{', '.join(str(int(v)) for v in p)}] is outside 0..255")
+            return w * h
+
+        if code == OP_LINECUT:
+            orientation, offset = p[0], p[1]
+            if orientation == 0:
+                if not x < offset < x + w:
+                    raise InvalidMove(line, f"cut [x] [{offset}] is outside [{self.name(a)}]")
+                self.geom[c] = (x, y, offset - x, h)
+                self.geom[c + 1] = (offset, y, x + w - offset, h)
+            else:
+                if not y < offset < y + h:
+                    raise InvalidMove(line, f"cut [y] [{offset}] is outside [{self.name(a)}]")
+                self.geom[c] = (x, y, w, offset - y)
+                self.geom[c + 1] = (x, offset, w, y + h - offset)
+            self.alive[a] = False
+            self.alive[c:c + 2] = True
+            return w * h
+
+        if code == OP_POINTCUT:
+            px, py = p[0], p[1]
+            if not (x < px < x + w and y < py < y + h):
+                raise InvalidMove(line, f"point [{px}, {py}] is outside [{self.name(a)}]")
+            #  3 2
+            #  0 1
+            self.geom[c] = (x, y, px - x, py - y)
+            self.geom[c + 1] = (px, y, x + w - px, py - y)
+            self.geom[c + 2] = (px, py, x + w - px, y + h - py)
+            self.geom[c + 3] = (x, py, px - x, y + h - py)
+            self.alive[a] = False
+            self.alive[c:c + 4] = True
+            return w * h
+
+        if not self.alive[b]:
+            raise InvalidMove(line, f"unknown block [{self.name(b)}]")
+        bx, by, bw, bh = self.geom[b].tolist()
+
+        if code == OP_SWAP:
+            if (w, h) != (bw, bh):
+                raise InvalidMove(line, f"blocks [{self.name(a)}] and [{self.name(b)}] have different shapes")
+            self.geom[a], self.geom[b] = (bx, by, w, h), (x, y, w, h)
+            return w * h
+
+        if a == b:
+            raise InvalidMove(line, f"cannot merge [{self.name(a)}] with itself")
+        if x == bx and w == bw and (y + h == by or by + bh == y):
+            self.geom[c] = (x, min(y, by), w, h + bh)
+        elif y == by and h == bh and (x + w == bx or bx + bw == x):
+            self.geom[c] = (min(x, bx), y, w + bw, h)
+        else:
+            raise InvalidMove(line, f"blocks [{self.name(a)}] and [{self.name(b)}] are not adjacent")
+        self.alive[a] = self.alive[b] = False
+        self.alive[c] = True
+        return max(w * h, bw * bh)
+
+    def decompile(self, op) -> Move:
+        code, a, b, c, p, line = op
+        kind = OPCODES[code]
+        if kind == "COLOR":
+            return Move(kind, (self.name(a),), tuple(p), line)
+        if kind == "LINECUT":
+            return Move(kind, (self.name(a),), ("x" if p[0] == 0 else "y", p[1]), line)
+        if kind == "POINTCUT":
+            return Move(kind, (self.name(a),), (p[0], p[1]), line)
+        return Move(kind, (self.name(a), self.name(b)), (), line)
+
+
+@dataclasses.dataclass
+class CompiledProgram:
+    """Moves compiled against the block table of one initial state.
+
+    The table also holds the execution state, so a compiled program can only be
+    run by one interpreter at a time.
+    """
+    table: BlockTable
+    ops: np.ndarray
+
+    def moves(self) -> typing.List[Move]:
+        return [self.table.decompile(op) for op in self.ops.tolist()]
+
+
+def compile_program(program, initial: InitialState = None) -> CompiledProgram:
+    table = BlockTable(initial or InitialState.blank())
+    ops = [table.compile(move) for move in to_moves(program)]
+    return CompiledProgram(table=table, ops=np.array(ops, dtype=OP_DTYPE))
+
+
+class Interpreter:
+    """Executes moves on a [x, y, rgba] canvas (same layout as open_as_np).
+
+    Blocks live in a BlockTable. Merged blocks do not need their children: the
+    canvas already holds the pixels, exactly as in Main.java. So there are no
+    compound blocks at all: a merge only writes the geometry of the new row
+    (O(1) however many blocks were merged before), a color on a merged block is
+    a plain rectangle fill, and a swap moves the pixels of both rectangles
+    through a scratch buffer.
+    """
+
+    def __init__(self, target, initial: InitialState = None):
+        self.target = np.asarray(target, dtype=np.int16)
+        self.initial = initial or InitialState.blank()
+        self.canvas_size = self.initial.width * self.initial.height
+        self.base_costs = [getattr(self.initial.base_costs, kind) for kind in OPCODES]
+        self.reset()
+
+    def reset(self, table: BlockTable = None):
+        self.canvas = self.initial.canvas.copy()
+        self.scratch = np.empty_like(self.canvas)
+        self.simil = SimilarityTiles(self.target, self.canvas)
+        self.table = table or BlockTable(self.initial)
+        self.table.reset()
+        self.cost = 0
+
+    def snapshot(self):
+        return (self.canvas.copy(), self.simil.snapshot(), self.table.state(), self.cost)
+
+    def restore(self, snapshot):
+        canvas, simil, table, self.cost = snapshot
+        np.copyto(self.canvas, canvas)
+        self.simil.restore(simil)
+        self.table.set_state(table)
+
+    def snapshot_bytes(self):
+        return self.canvas.nbytes + 20 * self.table.size
+
+    def op_cost(self, code, size):
+        return costs.server_round(self.base_costs[code] * self.canvas_size / size)
+
+    def apply(self, move: Move) -> int:
+        """Executes a single move, returns its cost"""
+        return self.execute(self.table.compile(move))
+
+    def execute(self, op) -> int:
+        """Executes a compiled move (a row of OP_DTYPE as a tuple), returns its cost"""
+        code, a, b, c, p, line = op
+        t = self.table
+        x, y, w, h = t.geom[a].tolist()
+        size = t.execute(op)
+
+        if code == OP_COLOR:
+            self.simil.paint(x, y, x + w, y + h, p)
+        elif code == OP_SWAP:
+            # the blocks already traded places in the table
+            bx, by = t.geom[a, :2].tolist()
+            s1 = (slice(x, x + w), slice(y, y + h))
+            s2 = (slice(bx, bx + w), slice(by, by + h))
+            pixels = self.scratch[:w, :h]
+            np.copyto(pixels, self.canvas[s1])
+            np.copyto(self.canvas[s1], self.canvas[s2])
+            np.copyto(self.canvas[s2], pixels)
+            self.simil.update(x, y, x + w, y + h)
+            self.simil.update(bx, by, bx + w, by + h)
+        return self.op_cost(code, size)
+
+    def similarity(self):
+        return self.simil.similarity()
+
+    def run(self, moves: typing.Iterable[Move]) -> Score:
+        for move in moves:
+            self.cost += self.apply(move)
+        return self.score()
+
+    def run_compiled(self, program: CompiledProgram) -> Score:
+        self.reset(program.table)
+        for op in program.ops.tolist():
+            self.cost += self.execute(op)
+        return self.score()
+
+    def score(self) -> Score:
+        return Score(cost=self.cost, similarity=self.similarity())
+
+
+class CheckpointedRun:
+    """Keeps interpreter snapshots every `every` moves of a program, so that
+    changing move i only re-executes the suffix from the closest checkpoint.
+
+    Edits may only change the parameters of a move (offsets, points, colors),
+    not its kind or blocks, so the compiled block nodes stay valid.
+    Without an explicit `every`, the interval is picked so that all snapshots
+    fit into `max_bytes`.
+    """
+
+    def __init__(self, interpreter: Interpreter, moves: typing.List[Move],
+                 every=None, max_bytes=CHECKPOINTS_MAX_BYTES):
+        self.interpreter = interpreter
+        self.moves = list(moves)
+        self.program = compile_program(self.moves, interpreter.initial)
+        self.ops = self.program.ops.tolist()
+        interpreter.reset(self.program.table)
+        if every is None:
+            max_checkpoints = max(1, max_bytes // interpreter.snapshot_bytes())
+            every = -(-len(self.moves) // max_checkpoints)
+        self.every = max(1, every)
+        self.checkpoints = {}
+        self.result = self._execute(0, record_until=len(self.ops))
+
+    def _execute(self, start, record_until, edit=None) -> Score:
+        """Runs ops[start:] from the checkpoint at `start`, recording new checkpoints before `record_until`"""
+        it = self.interpreter
+        if start in self.checkpoints:
+            it.restore(self.checkpoints[start])
+        edit_index, edit_op = edit or (-1, None)
+        for i in range(start, len(self.ops)):
+            if i % self.every == 0 and i < record_until and i not in self.checkpoints:
+                self.checkpoints[i] = it.snapshot()
+            it.cost += it.execute(edit_op if i == edit_index else self.ops[i])
+        return it.score()
+
+    def _checkpoint_before(self, i):
+        return max(k for k in self.checkpoints if k <= i)
+
+    def _edited_op(self, i, move: Move):
+        old = self.moves[i]
+        if move.kind != old.kind or tuple(move.blocks) != tuple(old.blocks):
+            raise ValueError(f"only parameters of move {i} can be changed: {old} -> {move}")
+        code, a, b, c, _, line = self.ops[i]
+        return (code, a, b, c, encode_params(move), line)
+
+    def try_move(self, i, move: Move) -> Score:
+        """Score of the program with moves[i] replaced, the run itself is left unchanged"""
+        edit = (i, self._edited_op(i, move))
+        return self._execute(self._checkpoint_before(i), record_until=i + 1, edit=edit)
+
+    def replace(self, i, move: Move) -> Score:
+        """Replaces moves[i] and re-executes the suffix, rebuilding later checkpoints"""
+        self.ops[i] = self._edited_op(i, move)
+        self.moves[i] = move
+        self.checkpoints = {k: v for k, v in self.checkpoints.items() if k <= i}
+        self.result = self._execute(self._checkpoint_before(i), record_until=len(self.ops))
+        return self.result
+
+
+def to_moves(program) -> typing.List[Move]:
+    """Program text, a list of command strings or a list of Moves"""
+    if isinstance(program, str):
+        return parse_program(program)
+    return [m if isinstance(m, Move) else parse_move(m, i + 1)
+            for i, m in enumerate(program)]
+
+
+def check_compiled(program: CompiledProgram, max_errors=None) -> typing.List[InvalidMove]:
+    """Validates a compiled program on the block table only, without any pixel work.
+
+    A move that fails is skipped and checking goes on, so all errors are reported
+    (later ones may be caused by the first).
+    """
+    table = program.table
+    table.reset()
+    errors = []
+    for op in program.ops.tolist():
+        try:
+            table.execute(op)
+        except InvalidMove as err:
+            errors.append(err)
+            if max_errors and len(errors) >= max_errors:
+                break
+    return errors
+
+
+def check_program(program, initial: InitialState = None, max_errors=None) -> typing.List[InvalidMove]:
+    """Errors of a program (see to_moves), including lines that cannot be parsed"""
+    errors = []
+    moves = parse_program(program, errors) if isinstance(program, str) else to_moves(program)
+    errors += check_compiled(compile_program(moves, initial), max_errors)
+    errors.sort(key=lambda err: err.line)
+    return errors[:max_errors] if max_errors else errors
+
+
+def score_program(target, program, initial: InitialState = None) -> Score:
+    """Scores a program (see to_moves) against a loaded target image"""
+    return Interpreter(target, initial).run(to_moves(program))
+
+
+def main():
+    check_only = "--check" in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != "--check"]
+    if len(args) < 2:
+        print("Usage: python3 -m solver.interpreter [--check] SOLUTION PROBLEM_ID")
+        sys.exit(1)
+
+    path, n = args
+    if check_only:
+        with open(path, "rt") as f:
+            errors = check_program(f.read(), load_initial_state(n))
+        for err in errors:
+            print(err)
+        print(f"{len(errors)} errors")
+        sys.exit(1 if errors else 0)
+
+    result = score_program(open_as_np(n), load_program(path), load_initial_state(n))
+    print(f"cost={result.cost} similarity={result.similarity} total={result.total}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+try:
+    import interpreter
+except ImportError:
+    import solver.interpreter as interpreter
+
+import hashlib
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+## Usage:
+## python3 -m solver.islb best_solutions solutions
+##
+## Compiles every solution under the given folders into ./cache/islb, so that
+## later loads are a single memory-mapped read of the compiled moves instead of
+## parsing ISL text. Entries are keyed by the sha256 of the program text, the
+## number of initial blocks and the layout of the compiled moves, so edited
+## files, other problems or an older compiled format never collide.
+
+CACHE_DIR = "./cache/islb"
+
+
+def problem_of(path) -> int:
+    """Problem id from names like 35.txt, 35_12345.txt or 20-cut.txt"""
+    return int(re.match(r"\d+", os.path.basename(path)).group(0))
+
+
+def program_key(data: bytes, initial: interpreter.InitialState) -> str:
+    h = hashlib.sha256(data)
+    h.update(f"\n{len(initial.blocks)}".encode())
+    # the compiled format: files written with another layout get other keys
+    h.update(f"\n{interpreter.OP_DTYPE.descr}".encode())
+    return h.hexdigest()
+
+
+def cache_path(key, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, key[:2], f"{key}.islb")
+
+
+def compile_cached(data: bytes, initial: interpreter.InitialState,
+                   cache_dir=CACHE_DIR) -> interpreter.CompiledProgram:
+    """Compiled program of `data` (raw ISL file contents), through the cache"""
+    path = cache_path(program_key(data, initial), cache_dir)
+    if os.path.exists(path):
+        ops = np.load(path, mmap_mode="r")
+        return interpreter.CompiledProgram(table=interpreter.BlockTable.from_ops(initial, ops), ops=ops)
+
+    program = interpreter.compile_program(interpreter.decode_program(data.decode()), initial)
+    # ids that did not exist are only kept by name, which the table cannot be rebuilt from
+    if program.table.unknown == 0:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, program.ops)
+        os.replace(tmp, path)
+    return program
+
+
+def load_compiled(path, initial: interpreter.InitialState = None,
+                  cache_dir=CACHE_DIR) -> interpreter.CompiledProgram:
+    with open(path, "rb") as f:
+        data = f.read()
+    return compile_cached(data, initial or interpreter.InitialState.blank(), cache_dir)
+
+
+def solution_files(folders):
+    for folder in folders:
+        for root, _, files in os.walk(folder):
+            for name in sorted(files):
+                if name.endswith(".txt") and name[0].isdigit():
+                    yield os.path.join(root, name)
+
+
+def main():
+    folders = sys.argv[1:] or ["best_solutions", "solutions"]
+    initial_states = {}
+    start = time.time()
+    count = 0
+    for path in solution_files(folders):
+        n = problem_of(path)
+        if n not in initial_states:
+            initial_states[n] = interpreter.load_initial_state(n)
+        load_compiled(path, initial_states[n])
+        count += 1
+    print(f"Compiled {count} solutions into {CACHE_DIR}, took {time.time() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
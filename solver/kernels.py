@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+
+# Hot similarity / median kernels. With ICFPC_KERNELS=numba (and numba installed)
+# they are compiled loops that compute differences, norms and sums in one pass
+# without temporaries, otherwise the numpy versions below are used. The choice
+# is made once at import; check parity with `python3 -m src.check_kernels`.
+
+KERNELS = os.environ.get("ICFPC_KERNELS", "numpy")
+
+numba = None
+if KERNELS == "numba":
+    try:
+        import numba
+    except ImportError:
+        print("ICFPC_KERNELS=numba but numba is not installed, using numpy kernels")
+
+JIT = numba is not None
+
+
+def norm_sum_numpy(a):
+    """Sum over pixels of the euclidean norm of a [x, y, channels] array"""
+    return np.linalg.norm(a, axis=(2)).sum()
+
+
+def distance_sum_numpy(a, b):
+    """norm_sum(a - b), b is an array of the same shape or a single color"""
+    return norm_sum_numpy(a - b)
+
+
+def norm_sum_loops(a):
+    w, h, channels = a.shape
+    total = 0.0
+    for i in range(w):
+        for j in range(h):
+            s = 0.0
+            for k in range(channels):
+                v = float(a[i, j, k])
+                s += v * v
+            total += np.sqrt(s)
+    return total
+
+
+def distance_sum_image_loops(a, b):
+    w, h, channels = a.shape
+    total = 0.0
+    for i in range(w):
+        for j in range(h):
+            s = 0.0
+            for k in range(channels):
+                v = float(a[i, j, k]) - float(b[i, j, k])
+                s += v * v
+            total += np.sqrt(s)
+    return total
+
+
+def distance_sum_color_loops(a, color):
+    w, h, channels = a.shape
+    total = 0.0
+    for i in range(w):
+        for j in range(h):
+            s = 0.0
+            for k in range(channels):
+                v = float(a[i, j, k]) - color[k]
+                s += v * v
+            total += np.sqrt(s)
+    return total
+
+
+def weiszfeld_loops(X, w, y, eps, max_iter):
+    """Weiszfeld iteration of geometric_median from `y` (updated in place)"""
+    k, d = X.shape
+    total = w.sum()
+    T = np.empty(d)
+    y1 = np.empty(d)
+    for _ in range(max_iter):
+        T[:] = 0.0
+        dinvs = 0.0
+        num_zeros = 0.0
+        for i in range(k):
+            s = 0.0
+            for j in range(d):
+                v = X[i, j] - y[j]
+                s += v * v
+            if s == 0.0:
+                num_zeros += w[i]
+                continue
+            dinv = w[i] / np.sqrt(s)
+            dinvs += dinv
+            for j in range(d):
+                T[j] += dinv * X[i, j]
+        if num_zeros == total:
+            break
+        for j in range(d):
+            T[j] /= dinvs
+
+        if num_zeros == 0.0:
+            y1[:] = T
+        else:
+            r = 0.0
+            for j in range(d):
+                v = (T[j] - y[j]) * dinvs
+                r += v * v
+            r = np.sqrt(r)
+            rinv = 0.0 if r == 0.0 else num_zeros / r
+            for j in range(d):
+                y1[j] = max(0.0, 1 - rinv) * T[j] + min(1.0, rinv) * y[j]
+
+        step = 0.0
+        for j in range(d):
+            v = y[j] - y1[j]
+            step += v * v
+            y[j] = y1[j]
+        if np.sqrt(step) < eps:
+            break
+    return y
+
+
+if JIT:
+    norm_sum = numba.njit(cache=True)(norm_sum_loops)
+    distance_sum_image = numba.njit(cache=True)(distance_sum_image_loops)
+    distance_sum_color = numba.njit(cache=True)(distance_sum_color_loops)
+    weiszfeld = numba.njit(cache=True)(weiszfeld_loops)
+
+    def distance_sum(a, b):
+        b = np.asarray(b)
+        if b.ndim == 1:
+            return distance_sum_color(a, b.astype(np.float64))
+        return distance_sum_image(a, np.broadcast_to(b, a.shape))
+else:
+    norm_sum = norm_sum_numpy
+    distance_sum = distance_sum_numpy
+    # only worth it compiled, callers keep their numpy loops
+    weiszfeld = None
@@ -0,0 +1,91 @@
+import collections
+import dataclasses
+import sys
+
+# Bounded memo tables for the binary solver. Solver.cache and
+# Solver.avg_color_cache grow with every (shape, color) improve() visits, which
+# runs out of memory at max_depth 6 on a 400x400 image; here the least recently
+# used entries are dropped once an entry or byte budget is exceeded. Sizes are
+# shallow estimates (sys.getsizeof of the key, the value and the containers and
+# dataclasses directly inside them), objects shared between entries are not
+# counted again.
+
+
+def approx_bytes(obj, nested=False):
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (tuple, list)):
+        size += sum(approx_bytes(v, nested=True) for v in obj)
+    elif dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        if nested:
+            # another entry's value, only referenced from here
+            return 0
+        size += sys.getsizeof(vars(obj))
+        size += sum(approx_bytes(v, nested=True) for v in vars(obj).values())
+    return size
+
+
+def entry_bytes(key, value):
+    return approx_bytes(key) + approx_bytes(value)
+
+
+class LRUCache:
+    def __init__(self, max_entries=None, max_bytes=None, sizeof=entry_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = collections.OrderedDict()  # key -> (value, bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """Value of the key, marked as most recently used, counted as a hit or a miss"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def peek(self, key, default=None):
+        """Value of the key without touching its position or the counters"""
+        entry = self.entries.get(key)
+        return default if entry is None else entry[0]
+
+    def __getitem__(self, key):
+        if key not in self.entries:
+            self.misses += 1
+            raise KeyError(key)
+        return self.get(key)
+
+    def __setitem__(self, key, value):
+        size = self.sizeof(key, value) if self.max_bytes is not None else 0
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self.entries[key] = (value, size)
+        self.bytes += size
+        self.evict()
+
+    def evict(self):
+        while len(self.entries) > 1 and (
+                (self.max_entries is not None and len(self.entries) > self.max_entries) or
+                (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            _, (_, size) = self.entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        size = f", {self.bytes / 2**20:.1f}MB" if self.max_bytes is not None else ""
+        return (f"{len(self.entries)} entries{size}, {self.hits} hits, {self.misses} misses "
+                f"({rate:.0%} hit rate), {self.evictions} evictions")
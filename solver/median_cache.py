@@ -0,0 +1,90 @@
+import os
+import sqlite3
+import threading
+
+# Geometric medians of image rectangles that outlive the process: the binary and
+# pixel solvers and the server look medians up here before running Weiszfeld, so
+# warm reruns and repeated UI requests skip it. Entries are keyed by problem,
+# rectangle, eps and method, since medians of the same pixels computed another
+# way (e.g. over the palette histogram, or in flipped order) can differ in the
+# last bits. SQLite in WAL mode lets several solver processes and the server
+# read and write at the same time.
+
+DB_PATH = "./cache/medians.sqlite"
+# rectangles per query of get_many, 4 variables each
+GET_MANY_CHUNK = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS medians (
+    problem INTEGER NOT NULL,
+    method TEXT NOT NULL,
+    eps REAL NOT NULL,
+    x1 INTEGER NOT NULL,
+    x2 INTEGER NOT NULL,
+    y1 INTEGER NOT NULL,
+    y2 INTEGER NOT NULL,
+    median TEXT NOT NULL,
+    PRIMARY KEY (problem, method, eps, x1, x2, y1, y2)
+);
+"""
+
+
+class MedianCache:
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        # one connection per thread (the server) and per forked process (solver pools)
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def connection(self):
+        local = self.local
+        if getattr(local, "pid", None) != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            local.db = sqlite3.connect(self.path, timeout=30)
+            local.db.execute("PRAGMA journal_mode=WAL")
+            local.db.execute("PRAGMA synchronous=NORMAL")
+            local.db.executescript(SCHEMA)
+            local.pid = os.getpid()
+        return local.db
+
+    def get(self, problem, method, eps, x1, y1, x2, y2):
+        """Cached median as a list of floats, or None"""
+        row = self.connection().execute(
+            "SELECT median FROM medians WHERE problem=? AND method=? AND eps=? AND x1=? AND x2=? AND y1=? AND y2=?",
+            (int(problem), method, eps, x1, x2, y1, y2)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [float(v) for v in row[0].split(",")]
+
+    def get_many(self, problem, method, eps, rects):
+        """Cached medians of the (x1, y1, x2, y2) rectangles that have one, in one
+        query per GET_MANY_CHUNK rectangles"""
+        rects = list(dict.fromkeys(tuple(rect) for rect in rects))
+        db = self.connection()
+        found = {}
+        for start in range(0, len(rects), GET_MANY_CHUNK):
+            chunk = rects[start:start + GET_MANY_CHUNK]
+            rows = db.execute(
+                "SELECT x1, y1, x2, y2, median FROM medians WHERE problem=? AND method=? AND eps=? "
+                f"AND (x1, y1, x2, y2) IN (VALUES {', '.join(['(?, ?, ?, ?)'] * len(chunk))})",
+                [int(problem), method, eps] + [int(v) for rect in chunk for v in rect])
+            for x1, y1, x2, y2, median in rows:
+                found[(x1, y1, x2, y2)] = [float(v) for v in median.split(",")]
+        self.hits += len(found)
+        self.misses += len(rects) - len(found)
+        return found
+
+    def put_many(self, problem, method, eps, medians):
+        """Store {(x1, y1, x2, y2): median} in one transaction"""
+        db = self.connection()
+        with db:
+            db.executemany(
+                "INSERT OR IGNORE INTO medians VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(int(problem), method, eps, x1, x2, y1, y2, ",".join(repr(float(v)) for v in median))
+                 for (x1, y1, x2, y2), median in medians.items()])
+
+    def put(self, problem, method, eps, x1, y1, x2, y2, median):
+        self.put_many(problem, method, eps, {(x1, y1, x2, y2): median})
@@ -0,0 +1,180 @@
+try:
+    import geometric_median as gm
+except ImportError:
+    import solver.geometric_median as gm
+
+try:
+    import interpreter
+except ImportError:
+    import solver.interpreter as interpreter
+
+import os
+import sys
+import time
+
+import numpy as np
+
+## Usage:
+## python3 -m solver.median_pyramid [PROBLEM ...]
+##
+## Builds (or refreshes) the cached median pyramids of the problems, default all.
+##
+## Level L splits the image into 2^L x 2^L cells and stores the geometric median
+## of every cell (fast_geometric_median from the parent cell's for large cells)
+## and its dispersion, the sum of the distances of the cell's
+## pixels to that median. A rectangle is answered from the largest cells that
+## fit in it (and the finest cells it partially overlaps): the median of the
+## cell medians, weighted by the pixels each one covers.
+##
+## Error bound: with D the summed dispersion of the cells used, every pixel is
+## within its cell's dispersion of the cell median, so for any color c
+## |sum |p - c| - sum n_k |m_k - c|| <= D. The approximate median is then at most
+## 2D worse than the exact one, i.e. its similarity is at most 2D * 0.005 higher.
+
+CACHE_DIR = "./cache/pyramid"
+MAX_LEVEL = 6
+EPS = 1e-1
+# cells with at least this many pixels are solved one by one from the median of
+# their parent cell, smaller ones in one batch per level
+WARM_START_PIXELS = 50 * 50
+
+
+class MedianPyramid:
+    def __init__(self, bounds, medians, dispersions):
+        # per level: cell edges (same on both axes), (n, n, channels) medians, (n, n) dispersions
+        self.bounds = bounds
+        self.medians = medians
+        self.dispersions = dispersions
+
+    @property
+    def max_level(self):
+        return len(self.medians) - 1
+
+    @classmethod
+    def build(cls, img, max_level=MAX_LEVEL, eps=EPS):
+        """Medians of the large cells warm started from their parent cell (the
+        edges of a level are every other edge of the next one), and of the
+        others in one batched solve per cell shape"""
+        img = np.asarray(img)
+        size = img.shape[0]
+        assert img.shape[1] == size, "square images only"
+        bounds, medians, dispersions = [], [], []
+        for level in range(max_level + 1):
+            n = 1 << level
+            edges = np.round(np.arange(n + 1) * size / n).astype(np.int64)
+            cells = [(i, j) for i in range(n) for j in range(n)]
+            tiles = [img[edges[i]:edges[i + 1], edges[j]:edges[j + 1]] for i, j in cells]
+            if (size // n) ** 2 >= WARM_START_PIXELS:
+                level_medians = np.array([
+                    gm.fast_geometric_median(tile.reshape((-1, tile.shape[2])), eps=eps,
+                                             init=medians[-1][i // 2, j // 2] if level > 0 else None)
+                    for (i, j), tile in zip(cells, tiles)], dtype=np.float64)
+            else:
+                level_medians = np.array(gm.tile_medians(tiles, eps=eps))
+
+            level_dispersions = np.zeros(len(cells))
+            by_shape = {}
+            for k, tile in enumerate(tiles):
+                by_shape.setdefault(tile.shape, []).append(k)
+            for (w, h, channels), ks in by_shape.items():
+                stack = np.stack([tiles[k].reshape(w * h, channels) for k in ks])
+                d = stack - level_medians[ks][:, None, :]
+                level_dispersions[ks] = np.sqrt(np.einsum("npc,npc->np", d, d)).sum(1)
+
+            bounds.append(edges)
+            medians.append(level_medians.reshape(n, n, -1))
+            dispersions.append(level_dispersions.reshape(n, n))
+        return cls(bounds, medians, dispersions)
+
+    def save(self, path):
+        arrays = {}
+        for level in range(len(self.medians)):
+            arrays[f"bounds_{level}"] = self.bounds[level]
+            arrays[f"medians_{level}"] = self.medians[level]
+            arrays[f"dispersions_{level}"] = self.dispersions[level]
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            levels = len([name for name in f.files if name.startswith("medians_")])
+            return cls([f[f"bounds_{level}"] for level in range(levels)],
+                       [f[f"medians_{level}"] for level in range(levels)],
+                       [f[f"dispersions_{level}"] for level in range(levels)])
+
+    def cells(self, x1, y1, x2, y2):
+        """Medians, covered pixel counts and summed dispersion of the cells
+        that make up the rectangle"""
+        colors, weights = [], []
+        dispersion = 0.0
+        covered = None
+        for level, edges in enumerate(self.bounds):
+            lo, hi = edges[:-1], edges[1:]
+            if covered is not None:
+                covered = covered.repeat(2, 0).repeat(2, 1)
+            if level < self.max_level:
+                # cells fully inside the rectangle, not already taken at a coarser level
+                in_x = (lo >= x1) & (hi <= x2)
+                in_y = (lo >= y1) & (hi <= y2)
+                take = np.outer(in_x, in_y)
+                cx = hi - lo
+                cy = cx
+            else:
+                # and every cell left that overlaps it at the finest level
+                cx = np.clip(np.minimum(hi, x2) - np.maximum(lo, x1), 0, None)
+                cy = np.clip(np.minimum(hi, y2) - np.maximum(lo, y1), 0, None)
+                take = np.outer(cx > 0, cy > 0)
+            if covered is not None:
+                take &= ~covered
+            if take.any():
+                i, j = np.nonzero(take)
+                colors.append(self.medians[level][i, j])
+                weights.append(cx[i] * cy[j])
+                dispersion += self.dispersions[level][i, j].sum()
+            covered = take if covered is None else covered | take
+        return np.concatenate(colors), np.concatenate(weights), dispersion
+
+    def query(self, x1, y1, x2, y2, eps=1e-2, max_error=None):
+        """Approximate geometric median of the rectangle and the bound on how much
+        higher its similarity can be than the exact median's. The median is None
+        if the bound is above `max_error`."""
+        colors, weights, dispersion = self.cells(x1, y1, x2, y2)
+        error = 2 * dispersion * 0.005
+        if max_error is not None and error > max_error:
+            return None, error
+        if len(colors) == 1:
+            return colors[0], error
+        return gm.geometric_median(colors, eps=eps, weights=weights), error
+
+
+def cache_path(n, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f"{n}.npz")
+
+
+def load_pyramid(n, img, max_level=MAX_LEVEL, cache_dir=CACHE_DIR) -> MedianPyramid:
+    """Median pyramid of problem n, cached while newer than the problem png"""
+    path = cache_path(n, cache_dir)
+    png_path = f"{interpreter.PROBLEMS_DIR}/{n}.png"
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(png_path):
+        pyramid = MedianPyramid.load(path)
+        if pyramid.max_level == max_level:
+            return pyramid
+
+    pyramid = MedianPyramid.build(img, max_level=max_level)
+    os.makedirs(cache_dir, exist_ok=True)
+    pyramid.save(path)
+    return pyramid
+
+
+def main():
+    problems = [int(v) for v in sys.argv[1:]] or range(1, 41)
+    for n in problems:
+        start = time.time()
+        load_pyramid(n, interpreter.open_as_np(n))
+        print(f"{n}: took {time.time() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
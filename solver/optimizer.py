@@ -0,0 +1,196 @@
+try:
+    import interpreter
+except ImportError:
+    import solver.interpreter as interpreter
+
+import dataclasses
+import multiprocessing
+import sys
+import time
+import typing
+
+## Usage:
+## python3 -m solver.optimizer <solution_in> <optimized_out> <problem id> [jobs] [rounds]
+##
+## Python port of `Main.optimize` from optimizer/src/main/java/solver/Main.java:
+## tries +-4 offsets for every line cut, a 9x9 grid around every point cut and,
+## unlike the jar, also tunes every color (per channel descent, the jar's 5^4
+## grid is commented out there because it is too slow). Candidates are scored
+## with a CheckpointedRun, so only the suffix after the edited move is re-executed.
+##
+## With jobs > 1 the moves are split between worker processes that look for the
+## best edit of each of their moves against the same program; the edits are then
+## re-checked and applied one by one, best first.
+##
+## Both modes repeat the pass up to `rounds` times (1 by default, like the jar),
+## stopping early after a round that improves nothing.
+
+CUT_RADIUS = 4
+COLOR_STEPS = [8, 2, 1]
+
+
+@dataclasses.dataclass
+class Edit:
+    index: int
+    move: interpreter.Move
+    total: int
+
+
+def line_cut_candidates(move: interpreter.Move):
+    orientation, offset = move.args
+    for d in range(-CUT_RADIUS, CUT_RADIUS + 1):
+        if d != 0:
+            yield dataclasses.replace(move, args=(orientation, offset + d))
+
+
+def point_cut_candidates(move: interpreter.Move):
+    x, y = move.args
+    for dx in range(-CUT_RADIUS, CUT_RADIUS + 1):
+        for dy in range(-CUT_RADIUS, CUT_RADIUS + 1):
+            if dx != 0 or dy != 0:
+                yield dataclasses.replace(move, args=(x + dx, y + dy))
+
+
+def try_total(run: interpreter.CheckpointedRun, i, move: interpreter.Move):
+    try:
+        return run.try_move(i, move).total
+    except interpreter.InvalidMove:
+        return None
+
+
+def best_edit(run: interpreter.CheckpointedRun, i) -> typing.Optional[Edit]:
+    """Best replacement of move i that beats the current program, the run is left unchanged"""
+    move = run.moves[i]
+    best = Edit(i, move, run.result.total)
+
+    if move.kind == "COLOR":
+        # coordinate descent over the channels, with decreasing steps
+        for step in COLOR_STEPS:
+            improved = True
+            while improved:
+                improved = False
+                for channel in range(4):
+                    for sign in (-1, 1):
+                        color = list(best.move.args)
+                        color[channel] = min(255, max(0, color[channel] + sign * step))
+                        if color == list(best.move.args):
+                            continue
+                        candidate = dataclasses.replace(move, args=tuple(color))
+                        total = try_total(run, i, candidate)
+                        if total is not None and total < best.total:
+                            best = Edit(i, candidate, total)
+                            improved = True
+    else:
+        if move.kind == "LINECUT":
+            candidates = line_cut_candidates(move)
+        elif move.kind == "POINTCUT":
+            candidates = point_cut_candidates(move)
+        else:
+            return None
+        for candidate in candidates:
+            total = try_total(run, i, candidate)
+            if total is not None and total < best.total:
+                best = Edit(i, candidate, total)
+
+    return best if best.move is not move else None
+
+
+def optimize_sequential(run: interpreter.CheckpointedRun, rounds=1, log=print):
+    """Same order as the jar: every move once per round, keeping each improvement right away"""
+    start = run.result.total
+    for n_round in range(rounds):
+        applied = 0
+        for i in range(len(run.moves)):
+            edit = best_edit(run, i)
+            if edit is not None:
+                before = run.result.total
+                run.replace(i, edit.move)
+                applied += 1
+                log(f"[{i}/{len(run.moves)}] ({edit.move.kind.lower()}) new best score found: "
+                    f"{before} -> {run.result.total} (start = {start}, improve = {start - run.result.total})")
+        log(f"Round {n_round}: {applied} applied")
+        if applied == 0:
+            break
+    return run.result
+
+
+# per worker process
+WORKER_RUN = None
+
+
+def init_worker(target, initial, moves):
+    global WORKER_RUN
+    WORKER_RUN = interpreter.CheckpointedRun(interpreter.Interpreter(target, initial), moves)
+
+
+def worker_edits(indices):
+    return [edit for edit in (best_edit(WORKER_RUN, i) for i in indices) if edit is not None]
+
+
+def optimize_parallel(run: interpreter.CheckpointedRun, jobs, rounds=1, log=print):
+    start = run.result.total
+    it = run.interpreter
+    for n_round in range(rounds):
+        chunks = [list(range(j, len(run.moves), jobs)) for j in range(jobs)]
+        with multiprocessing.Pool(jobs, initializer=init_worker,
+                                  initargs=(it.target, it.initial, run.moves)) as pool:
+            edits = [edit for chunk in pool.map(worker_edits, chunks) for edit in chunk]
+
+        # edits were found independently, keep those that still improve the combined program
+        applied = 0
+        for edit in sorted(edits, key=lambda e: e.total):
+            before = run.result.total
+            total = try_total(run, edit.index, edit.move)
+            if total is not None and total < before:
+                run.replace(edit.index, edit.move)
+                applied += 1
+                log(f"[{edit.index}/{len(run.moves)}] ({edit.move.kind.lower()}) new best score found: "
+                    f"{before} -> {run.result.total} (start = {start}, improve = {start - run.result.total})")
+        log(f"Round {n_round}: {len(edits)} edits found, {applied} applied")
+        if applied == 0:
+            break
+    return run.result
+
+
+def optimize(target, initial: interpreter.InitialState, moves: typing.List[interpreter.Move],
+             jobs=1, rounds=1, log=print) -> interpreter.CheckpointedRun:
+    run = interpreter.CheckpointedRun(interpreter.Interpreter(target, initial), moves)
+    if jobs > 1:
+        optimize_parallel(run, jobs, rounds=rounds, log=log)
+    else:
+        optimize_sequential(run, rounds=rounds, log=log)
+    return run
+
+
+def write_result(path, run: interpreter.CheckpointedRun, initial_total):
+    with open(path, "wt") as f:
+        f.write("################# BEST RESULT #########################\n")
+        for move in run.moves:
+            f.write(f"{move}\n")
+        r = run.result
+        f.write(f"# ExecutionResult{{initialCost={initial_total}, programCost={r.cost}, "
+                f"imageDiffCost={r.similarity}, totalCost={r.total}}}\n")
+
+
+def main():
+    if len(sys.argv) < 4:
+        print("Usage: python3 -m solver.optimizer SOLUTION_IN OPTIMIZED_OUT PROBLEM_ID [JOBS] [ROUNDS]")
+        sys.exit(1)
+
+    path_in, path_out, n = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    jobs = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    rounds = int(sys.argv[5]) if len(sys.argv) > 5 else 1
+    moves = interpreter.load_program(path_in)
+    target = interpreter.open_as_np(n)
+    initial = interpreter.load_initial_state(n)
+
+    print(f"Running on {n}")
+    start_time = time.time()
+    initial_total = interpreter.score_program(target, moves, initial).total
+    run = optimize(target, initial, moves, jobs=jobs, rounds=rounds)
+    print(f"Optimized {initial_total} -> {run.result.total} (took {time.time() - start_time:.1f}s)")
+    write_result(path_out, run, initial_total)
+
+
+if __name__ == "__main__":
+    main()
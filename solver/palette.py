@@ -0,0 +1,52 @@
+try:
+    import geometric_median as gm
+except ImportError:
+    import solver.geometric_median as gm
+
+import numpy as np
+
+# Many targets (chess, tetris, text) only have a few hundred distinct colors.
+# PaletteImage stores an image as its palette plus an index map, so that a
+# rectangle is described by a sparse histogram of (color, count) pairs and
+# medians / similarities run over its distinct colors instead of every pixel.
+
+
+class PaletteImage:
+    def __init__(self, img):
+        img = np.asarray(img)
+        w, h, channels = img.shape
+        # one uint32 per rgba pixel, much faster to unique than rows
+        shifts = np.arange(channels - 1, -1, -1, dtype=np.uint32) * 8
+        keys = (img.reshape(-1, channels).astype(np.uint32) << shifts).sum(1, dtype=np.uint32)
+        palette, index = np.unique(keys, return_inverse=True)
+        self.palette = ((palette[:, None] >> shifts) & 0xFF).astype(np.int64)
+        # uint16 as long as the palette fits, photos can have >65536 colors
+        dtype = np.uint16 if len(palette) <= 1 << 16 else np.uint32
+        self.index = index.reshape(w, h).astype(dtype)
+
+    def __len__(self):
+        return len(self.palette)
+
+    def histogram(self, x1, y1, x2, y2):
+        """Palette ids present in the rectangle and their pixel counts"""
+        ids = self.index[x1:x2, y1:y2].ravel()
+        if len(ids) * 8 < len(self.palette):
+            return np.unique(ids, return_counts=True)
+        counts = np.bincount(ids, minlength=len(self.palette))
+        present = np.flatnonzero(counts)
+        return present, counts[present]
+
+    def colors(self, x1, y1, x2, y2):
+        """Distinct colors of the rectangle and their pixel counts"""
+        ids, counts = self.histogram(x1, y1, x2, y2)
+        return self.palette[ids], counts
+
+    def geometric_median(self, x1, y1, x2, y2, eps=1e-0):
+        colors, counts = self.colors(x1, y1, x2, y2)
+        return gm.geometric_median(colors, eps=eps, weights=counts)
+
+    def float_simil(self, color, x1, y1, x2, y2):
+        """Same as costs.float_simil(img[x1:x2, y1:y2] - color)"""
+        colors, counts = self.colors(x1, y1, x2, y2)
+        d = colors - np.asarray(color)
+        return np.dot(np.sqrt(np.einsum("ij,ij->i", d, d)), counts) * 0.005
@@ -2,9 +2,10 @@
 
 import sys
 from src.utils import open_as_np
-from solver.geometric_median import geometric_median
+from solver.geometric_median import geometric_median, tile_medians
 import math
 import solver.costs as costs_m
+import solver.interpreter as interpreter
 
 class Prog:
     def __init__(self):
@@ -194,14 +195,17 @@ class PixelSolver:
     def run(self):
         block = Block("0", begin = (0, 0), end = (400, 400))
 
+        # medians of the whole tile grid in one batched solve
+        corners = [(x, y) for y in range(0, 400, self.pixel_size) for x in range(0, 400, self.pixel_size)]
+        medians = dict(zip(corners, tile_medians(
+            [self.img[x:x + self.pixel_size, y:y + self.pixel_size] for x, y in corners], eps=1e-2)))
+
         for y in reversed(range(0, 400, self.pixel_size)):
             print (f"y = {y}");
             for x in reversed(range(0, 400, self.pixel_size)):
                 x1 = x + self.pixel_size
                 y1 = y + self.pixel_size
-                subimg = self.img[x:x1, y:y1]
-                color = [round(int(v)) for v in geometric_median(
-                        subimg.reshape((subimg.shape[0] * subimg.shape[1], 4)), eps=1e-2)]
+                color = [round(int(v)) for v in medians[(x, y)]]
 
                 # Dont' draw if difference is too small
                 if dist(color, self.BACKGROUND) < 10:
@@ -223,6 +227,9 @@ if __name__ == "__main__":
     solver = PixelSolver(problem=problem, pixel_size=pixel_size)
     solver.run()
 
+    result = interpreter.score_program(solver.img, solver.prog.cmds, interpreter.load_initial_state(problem))
+    print(f"Local score: {result.total} (cost {result.cost}, similarity {result.similarity})")
+
 
     with open(f"solutions/pixel_solver/{problem}.txt", "wt") as f:
         f.write("\n".join(solver.prog.cmds))
@@ -3,10 +3,13 @@ from re import S
 import sys
 from typing import Dict, Tuple
 from src.utils import open_as_np
-from solver.geometric_median import geometric_median
+from solver.geometric_median import tile_medians
 import math
 import solver.pixel as pix
 import solver.costs as costs_m
+import solver.color_search as color_search
+import solver.median_cache as median_cache
+import solver.interpreter as interpreter
 import dataclasses
 import numpy as np
 import traceback
@@ -23,10 +26,13 @@ class LogEntry:
     def total_cost(self):
         return self.cost + self.similarity
 
+MEDIAN_EPS = 1e-2
+
 class PixelSolver2:
     pixel_color: Dict[Tuple[int, int], Tuple[int, int, int, int]] = None
 
-    def __init__(self, problem_id, start_block, max_block_id, pixel_size, max_steps = -1):
+    def __init__(self, problem_id, start_block, max_block_id, pixel_size, max_steps = -1, exact_colors=False,
+                 sample_rate=None):
         assert isinstance(max_block_id, int), f"not an int: {max_block_id}"
 
         self.prog = pix.Prog()
@@ -36,7 +42,14 @@ class PixelSolver2:
         self.log = []
 
         self.pixel_size = pixel_size
+        self.problem_id = problem_id
         self.img = open_as_np(problem_id)
+        self.medians = {}
+        self.median_cache = median_cache.MedianCache()
+        # replace rounded medians by the best integer color of the tile
+        self.exact_colors = exact_colors
+        # share of the tile pixels the exact search screens values on, all of them if None
+        self.sample_rate = sample_rate
 
         self.BACKGROUND = (255, 255, 255, 255)
         self.prog.color(start_block.name, self.BACKGROUND, start_block.sq_size())
@@ -79,7 +92,7 @@ class PixelSolver2:
             color = self.get_pixel_color(x, y)
             canvas[x:x+self.pixel_size, y:y+self.pixel_size] = np.array(color)
 
-        return costs_m.simil(self.img - canvas)
+        return round(costs_m.float_simil_between(self.img, canvas))
 
     def merge(self, a, b, a_sq_size, b_sq_size):
         assert isinstance(a, str), f"not a str: {a}"
@@ -89,17 +102,55 @@ class PixelSolver2:
         self.global_counter += 1
         return str(self.global_counter)
 
+    def median_method(self, key):
+        return "pixels"
+
+    def prefetch_medians(self, keys, tiles):
+        """Geometric medians of many tiles in one batched solve, cached by key: the
+        tile's canvas rectangle, then anything that changes the order of its pixels"""
+        missing = {}
+        for key, tile in zip(keys, tiles):
+            if key not in self.medians:
+                missing[key] = tile
+        by_method = {}
+        for key in missing:
+            by_method.setdefault(self.median_method(key), []).append(key)
+        for method, method_keys in by_method.items():
+            cached = self.median_cache.get_many(self.problem_id, method, MEDIAN_EPS, [key[:4] for key in method_keys])
+            for key in method_keys:
+                if key[:4] in cached:
+                    self.medians[key] = cached[key[:4]]
+        todo = {key: tile for key, tile in missing.items() if key not in self.medians}
+
+        computed = dict(zip(todo.keys(), tile_medians(list(todo.values()), eps=MEDIAN_EPS)))
+        self.medians.update(computed)
+        by_method = {}
+        for key, median in computed.items():
+            by_method.setdefault(self.median_method(key), {})[key[:4]] = median
+        for method, medians in by_method.items():
+            self.median_cache.put_many(self.problem_id, method, MEDIAN_EPS, medians)
+
+    def tile_median(self, key, tile):
+        if key not in self.medians:
+            self.prefetch_medians([key], [tile])
+        return [round(int(v)) for v in self.medians[key]]
+
+    def tile_color(self, key, tile):
+        color = self.tile_median(key, tile)
+        if self.exact_colors:
+            color = color_search.best_color(tile.reshape((-1, tile.shape[-1])), color,
+                                             sample_rate=self.sample_rate)
+        return color
+
     def pick_color(self, x, y, color_width, color_height):
         x1 = x + self.pixel_size
         y1 = y + self.pixel_size
         subimg = self.img[x:x1, y:y1]
-        color = [round(int(v)) for v in geometric_median(
-            subimg.reshape((subimg.shape[0] * subimg.shape[1], 4)), eps=1e-2)]
+        color = self.tile_color((x, y, x + subimg.shape[0], y + subimg.shape[1]), subimg)
 
         color_cost = costs_m.get_cost(
             costs_m.COSTS.COLOR, color_width * color_height)
-        new_simil = costs_m.float_simil(subimg - color)
-        old_simil = costs_m.float_simil(subimg - self.get_pixel_color(x,y))
+        new_simil, old_simil = costs_m.float_simils(subimg, [color, self.get_pixel_color(x,y)])
         # print(
         #     f"color_cost at {x} {y} {color_cost} old_simil {old_simil} new_simil {new_simil} (has {self.get_pixel_color(x,y)} need {color})")
         if old_simil > new_simil + color_cost:
@@ -171,11 +222,15 @@ class PixelSolver2:
     def run(self):
         self.log_state("initial")
 
+        tiles = [(x, y, self.img[x:x+self.pixel_size, y:y+self.pixel_size]) for x, y in self.iterate_pixel_idx()]
+        self.prefetch_medians([(x, y, x + tile.shape[0], y + tile.shape[1]) for x, y, tile in tiles],
+                              [tile for _, _, tile in tiles])
         self.pixelize_block(self.start_block, self.start_block.begin[0], self.start_block.begin[1], self.max_steps)
 
         self.log_state("final")
 
-def run_pixel_solver(problem_id, start_block, max_block_id, pixel_size, max_steps=-1):
+def run_pixel_solver(problem_id, start_block, max_block_id, pixel_size, max_steps=-1, exact_colors=False,
+                     sample_rate=None):
     try:
         log_entries = []
         for ps in range(pixel_size - 5, pixel_size + 5):
@@ -184,7 +239,9 @@ def run_pixel_solver(problem_id, start_block, max_block_id, pixel_size, max_step
                 start_block=start_block,
                 max_block_id=max_block_id,
                 pixel_size=ps,
-                max_steps=max_steps)
+                max_steps=max_steps,
+                exact_colors=exact_colors,
+                sample_rate=sample_rate)
 
             solver.run()
             log_entries.extend(solver.log)
@@ -218,5 +275,9 @@ if __name__ == "__main__":
         max_block_id = start,
         pixel_size = pixel_size)
 
+    if start == 0:
+        result = interpreter.score_program(open_as_np(problem_id), cmds, interpreter.load_initial_state(problem_id))
+        print(f"Local score: {result.total} (cost {result.cost}, similarity {result.similarity})")
+
     with open(f"solutions/pixel_solver2/{problem_id}.txt", "wt") as f:
         f.write("\n".join(cmds))
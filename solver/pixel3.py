@@ -2,11 +2,11 @@ from itertools import product
 from re import S
 import sys
 from src.utils import open_as_np
-from solver.geometric_median import geometric_median
 import math
 import solver.pixel as pix
 import solver.pixel2 as pix2
 import solver.costs as costs_m
+import solver.interpreter as interpreter
 import dataclasses
 import numpy as np
 import traceback
@@ -27,8 +27,10 @@ class PixelSolver3(pix2.PixelSolver2):
     BACKGROUND = np.array([255, 255, 255, 255])
     canvas: np.ndarray = None
 
-    def __init__(self, problem_id, start_block, max_block_id, pixel_size, max_steps = -1, gravity_point=(400,400)):
-        super().__init__(problem_id, start_block, max_block_id, pixel_size, max_steps=max_steps)
+    def __init__(self, problem_id, start_block, max_block_id, pixel_size, max_steps = -1, gravity_point=(400,400),
+                 exact_colors=False, sample_rate=None):
+        super().__init__(problem_id, start_block, max_block_id, pixel_size, max_steps=max_steps,
+                         exact_colors=exact_colors, sample_rate=sample_rate)
         self.gravity_point = gravity_point
         self.subimg = self.img[:,:]
         # create a matrix of indexes, such that indexes[x][y] -> (x,y)
@@ -41,25 +43,39 @@ class PixelSolver3(pix2.PixelSolver2):
         self.canvas = np.zeros(np.shape(self.img), dtype=np.uint16)
         self.canvas[:,:] = self.BACKGROUND
         self.subcanvas = self.canvas[:,:]
+        self.simil = interpreter.SimilarityTiles(self.img, self.canvas)
 
     def get_pixel_color(self, x, y):
         return self.canvas[x, y]
 
     def compute_similarity(self):
-        return costs_m.simil(self.img - self.canvas)
+        return self.simil.similarity()
 
     def set_pixel_color(self, x, y, color:np.array):
         self.subcanvas[x:,y:] = color
+        # subcanvas may be flipped, take the repainted rectangle in canvas coordinates
+        xs, ys = self.subindices[0, x:, 0], self.subindices[1, 0, y:]
+        if len(xs) and len(ys):
+            self.simil.update(xs.min(), ys.min(), xs.max() + 1, ys.max() + 1)
+
+    def tile_key(self, x, y):
+        """Canvas rectangle and flip of the tile at x, y of the current block"""
+        xs = self.subindices[0, x:x+self.pixel_size, 0]
+        ys = self.subindices[1, 0, y:y+self.pixel_size]
+        return (int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1, self.flip)
+
+    def median_method(self, key):
+        # flipped tiles list their pixels in another order
+        dx, dy = key[4]
+        return "pixels" if (dx, dy) == (1, 1) else f"pixels flipped {dx},{dy}"
 
     def pick_color(self, x, y, color_width, color_height):
         subpixel = self.subimg[x:x+self.pixel_size, y:y+self.pixel_size]
-        color = [round(int(v)) for v in geometric_median(
-            subpixel.reshape((subpixel.shape[0] * subpixel.shape[1], 4)), eps=1e-2)]
+        color = self.tile_color(self.tile_key(x, y), subpixel)
 
         color_cost = costs_m.get_cost(
             costs_m.COSTS.COLOR, color_width * color_height)
-        new_simil = costs_m.float_simil(subpixel - color)
-        old_simil = costs_m.float_simil(subpixel - self.subcanvas[x,y])
+        new_simil, old_simil = costs_m.float_simils(subpixel, [color, self.subcanvas[x,y]])
         if old_simil > new_simil + color_cost:
             return color
         else:
@@ -84,6 +100,7 @@ class PixelSolver3(pix2.PixelSolver2):
         dx = 1 if mx <= gx else -1
         dy = 1 if my <= gy else -1
         print('>>>', 'b', (x0,y0), (x1,y1), 'm', (mx, my), 'g', (gx, gy), 'd', (dx,dy))
+        self.flip = (dx, dy)
         self.subimg = self.img[x0:x1,y0:y1][::dx,::dy]
         self.subcanvas = self.canvas[x0:x1,y0:y1][::dx,::dy]
         self.subindices = self.indices[:,x0:x1,y0:y1][:,::dx,::dy]
@@ -94,10 +111,16 @@ class PixelSolver3(pix2.PixelSolver2):
         if max_steps == 0:
             return
 
+        # the corner tile, the row and the column picked below
+        corners = ([(xs, 0) for xs in range(0, width, self.pixel_size)] +
+                   [(0, ys) for ys in range(self.pixel_size, height, self.pixel_size)])
+        self.prefetch_medians([self.tile_key(x, y) for x, y in corners],
+                              [self.subimg[x:x+self.pixel_size, y:y+self.pixel_size] for x, y in corners])
+
         color = self.pick_color(0, 0, width, height)
         if color:
             self.prog.color(block.name, color, block.sq_size())
-            self.subcanvas[0:,0:] = color
+            self.set_pixel_color(0, 0, color)
 
         # Horizontal row
         # for xs in range(x + self.pixel_size, x + width, self.pixel_size):
@@ -109,7 +132,7 @@ class PixelSolver3(pix2.PixelSolver2):
                 left, right = block.line_x(abs_x, self.prog)
                 block_to_color = right if dx == 1 else left
                 self.prog.color(block_to_color.name, color, right.sq_size())
-                self.subcanvas[xs:,0:] = color
+                self.set_pixel_color(xs, 0, color)
                 cur_name = self.merge(left.name, right.name, left.sq_size(), right.sq_size())
                 block = pix.Block(cur_name, block.begin, block.end)
 
@@ -123,7 +146,7 @@ class PixelSolver3(pix2.PixelSolver2):
                 bottom, top = block.line_y(abs_y, self.prog)
                 block_to_color = top if dy == 1 else bottom
                 self.prog.color(block_to_color.name, color, top.sq_size())
-                self.subcanvas[0:,ys:] = color
+                self.set_pixel_color(0, ys, color)
                 cur_name = self.merge(bottom.name, top.name, bottom.sq_size(), top.sq_size())
                 block = pix.Block(cur_name, block.begin, block.end)
 
@@ -146,7 +169,8 @@ class PixelSolver3(pix2.PixelSolver2):
 
             self.pixelize_block(next_block, max_steps - 1)
 
-def run_pixel_solver(problem_id, start_block, max_block_id, gravity_point, pixel_size, max_steps=-1):
+def run_pixel_solver(problem_id, start_block, max_block_id, gravity_point, pixel_size, max_steps=-1,
+                     exact_colors=False, sample_rate=None):
     try:
         log_entries = []
         for ps in range(pixel_size//2, pixel_size*2, pixel_size//4):
@@ -158,6 +182,8 @@ def run_pixel_solver(problem_id, start_block, max_block_id, gravity_point, pixel
                 pixel_size=ps,
                 max_steps=max_steps,
                 gravity_point=gravity_point,
+                exact_colors=exact_colors,
+                sample_rate=sample_rate,
             )
 
             solver.run()
@@ -0,0 +1,77 @@
+import sys
+import time
+
+import numpy as np
+
+import solver.costs as costs
+import solver.geometric_median as gm
+from src.utils import open_as_np
+
+## Usage:
+## python3 -m src.bench_geometric_median [TILE_SIZE] [EPS]
+##
+## Times geometric_median against fast_geometric_median on every problem image:
+## the whole image and every TILE_SIZE (default 100) tile, cold (from the mean)
+## and warm (from the whole image median, like a parent block would). Also reports
+## how many rounded colors differ from the reference implementation and what that
+## costs in similarity (the solvers round medians before painting).
+
+PROBLEMS = range(1, 41)
+
+
+def timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    result = f(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def rounded(color):
+    return tuple(round(v) for v in color)
+
+
+def simil(tile, color):
+    return costs.float_simil(tile - np.array(rounded(color)))
+
+
+def main():
+    tile = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    eps = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+
+    totals = np.zeros(3)
+    diffs = np.zeros(2, dtype=int)
+    simil_deltas = np.zeros(2)
+    count = 0
+    print(f"{'problem':>7} {'reference':>10} {'fast':>8} {'warm':>8}  diffs")
+    for n in PROBLEMS:
+        img = open_as_np(n)
+        whole = img.reshape((-1, 4))
+        parent, _ = timed(gm.geometric_median, whole, eps=eps)
+
+        times = np.zeros(3)
+        problem_diffs = np.zeros(2, dtype=int)
+        for x in range(0, img.shape[0], tile):
+            for y in range(0, img.shape[1], tile):
+                sub = img[x:x + tile, y:y + tile]
+                X = sub.reshape((-1, 4))
+                ref, t0 = timed(gm.geometric_median, X, eps=eps)
+                fast, t1 = timed(gm.fast_geometric_median, X, eps=eps)
+                warm, t2 = timed(gm.fast_geometric_median, X, eps=eps, init=parent)
+                times += (t0, t1, t2)
+                problem_diffs += (rounded(ref) != rounded(fast), rounded(ref) != rounded(warm))
+                s = simil(sub, ref)
+                simil_deltas += (simil(sub, fast) - s, simil(sub, warm) - s)
+                count += 1
+
+        totals += times
+        diffs += problem_diffs
+        print(f"{n:>7} {times[0]:>9.3f}s {times[1]:>7.3f}s {times[2]:>7.3f}s  {problem_diffs[0]}/{problem_diffs[1]}")
+
+    print(f"\n{count} tiles of {tile}px, eps={eps}")
+    print(f"reference {totals[0]:.2f}s, fast {totals[1]:.2f}s ({totals[0] / totals[1]:.1f}x), "
+          f"warm {totals[2]:.2f}s ({totals[0] / totals[2]:.1f}x)")
+    print(f"rounded colors different from the reference: fast {diffs[0]}, warm {diffs[1]}")
+    print(f"similarity change over all tiles: fast {simil_deltas[0]:+.1f}, warm {simil_deltas[1]:+.1f}")
+
+
+if __name__ == "__main__":
+    main()
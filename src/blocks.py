@@ -5,8 +5,9 @@ from typing import List, Tuple, Deque
 
 from solver.costs import simil, COSTS
 from solver.geometric_median import geometric_median
+from solver.integral_image import IntegralImage
+from solver.interpreter import load_initial_state
 from utils import open_as_np
-import json
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -14,24 +15,26 @@ load_dotenv()
 from server.api import icfpc
 
 def read_initial_json(n):
-    with open(f"./problems/{n}.initial.json", "rt") as f:
-        json_obj = json.load(f)
-        blocks=[
-            Block(
-                x=b["bottomLeft"][0],
-                y=b["bottomLeft"][1],
-                w=b["topRight"][0]-b["bottomLeft"][0],
-                h=b["topRight"][1]-b["bottomLeft"][1],
-                id=b["blockId"],
-                color=tuple(b["color"]))
-            for b in json_obj["blocks"]
-        ]
-        return blocks
+    # png blocks (problems 36+) have no color, use the mean of their pixels on the rendered canvas
+    initial = load_initial_state(n)
+    blocks=[
+        Block(
+            x=b.x1,
+            y=b.y1,
+            w=b.x2-b.x1,
+            h=b.y2-b.y1,
+            id=b.block_id,
+            color=tuple(b.color) if b.color is not None else
+                tuple(np.round(initial.canvas[b.x1:b.x2, b.y1:b.y2].mean(axis=(0, 1))).astype(int).tolist()))
+        for b in initial.blocks
+    ]
+    return blocks
 class Problem:
     def __init__(self, n):
         self.code: List = []
         self.costs: List = []
         self.a = open_as_np(n)
+        self.integrals = IntegralImage(self.a)
         self.simils: List = []
         self.cnt = 1
         if n>25:
@@ -123,7 +126,7 @@ class Block:
         return simil(problem.a[self.x:self.x+self.w, self.y:self.y+self.h]-self.get_mean_color(problem))
 
     def get_mean_color(self, problem: Problem):
-        return problem.a[self.x:self.x+self.w, self.y:self.y+self.h].mean(axis=(0,1)).round()
+        return problem.integrals.mean(self.x, self.y, self.x+self.w, self.y+self.h).round()
 
     def get_median_color(self, problem: Problem):
         return geometric_median(problem.a[self.x:self.x+self.w, self.y:self.y+self.h].reshape((-1 ,4)), eps=0.1).round()
@@ -0,0 +1,82 @@
+import sys
+
+import numpy as np
+
+import solver.costs as costs
+import solver.geometric_median as gm
+import solver.kernels as kernels
+from src.utils import open_as_np
+
+## Usage:
+## ICFPC_KERNELS=numba python3 -m src.check_kernels [PROBLEM ...]
+##
+## Parity of the compiled kernels with the numpy ones on the problem images:
+## similarities of random rectangles to random colors and to other rectangles,
+## and geometric medians of tiles (rounded colors, as the solvers use them).
+## Without numba the same loops run uncompiled on small tiles of a few problems,
+## which checks the code but not the speed.
+
+TOLERANCE = 1e-9
+
+
+def check(name, got, expected, failures):
+    if abs(got - expected) > TOLERANCE * max(1.0, abs(expected)):
+        failures.append(f"{name}: {got} != {expected}")
+
+
+def main():
+    if kernels.JIT:
+        problems = [int(v) for v in sys.argv[1:]] or range(1, 41)
+        tile, rects = 50, 20
+        norm_sum, distance_sum, weiszfeld = kernels.norm_sum, kernels.distance_sum, kernels.weiszfeld
+    else:
+        print("numba kernels are not active, checking the uncompiled loops on small tiles")
+        problems = [int(v) for v in sys.argv[1:]] or [2, 11, 30]
+        tile, rects = 10, 3
+
+        def distance_sum(a, b):
+            b = np.asarray(b)
+            if b.ndim == 1:
+                return kernels.distance_sum_color_loops(a, b.astype(np.float64))
+            return kernels.distance_sum_image_loops(a, np.broadcast_to(b, a.shape))
+
+        norm_sum, weiszfeld = kernels.norm_sum_loops, kernels.weiszfeld_loops
+
+    rng = np.random.default_rng(0)
+    failures = []
+    median_diffs = 0
+    medians = 0
+    for n in problems:
+        img = open_as_np(n)
+        size = 400 if kernels.JIT else 40
+        for _ in range(rects):
+            x, y = rng.integers(0, 400 - size // 2, 2)
+            a = img[x:x + size // 2, y:y + size // 2]
+            b = img[400 - size // 2 - x:400 - x, 400 - size // 2 - y:400 - y]
+            color = rng.integers(0, 256, 4)
+            check(f"{n} norm_sum", norm_sum(a - b), kernels.norm_sum_numpy(a - b), failures)
+            check(f"{n} distance_sum image", distance_sum(a, b), kernels.distance_sum_numpy(a, b), failures)
+            check(f"{n} distance_sum color", distance_sum(a, color), kernels.distance_sum_numpy(a, color), failures)
+
+        for x in range(0, size, tile):
+            for y in range(0, size, tile):
+                X = img[x:x + tile, y:y + tile].reshape((-1, 4)).astype(np.float64)
+                expected = [round(v) for v in gm.numpy_geometric_median(X, eps=0.5)]
+                got = [round(v) for v in weiszfeld(X, np.ones(len(X)), X.mean(0), 0.5, 1 << 30)]
+                medians += 1
+                if got != expected:
+                    median_diffs += 1
+                    failures.append(f"{n} median at {x},{y}: {got} != {expected}")
+        print(f"{n}: ok" if not failures else f"{n}: {len(failures)} failures so far")
+
+    print(f"{medians} medians, {median_diffs} rounded differently")
+    # float_simil goes through the selected backend
+    img = open_as_np(problems[0])
+    print(f"float_simil backend={'numba' if kernels.JIT else 'numpy'}: {costs.float_simil(img - 255)}")
+    for failure in failures[:20]:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
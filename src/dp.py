@@ -9,6 +9,7 @@ load_dotenv()
 from utils import open_as_np, save_from_np
 
 from solver.costs import COSTS
+from solver.integral_image import IntegralImage
 
 from server.api import icfpc
 
@@ -16,16 +17,9 @@ from server.api import icfpc
 ## python3 -m src.dp
 ##
 
-def best_pixel(y, pixels):
-    sum = [0, 0, 0, 0]
-    for x in range(400):
-        p = pixels[(x, y)]
-        for i in range(4):
-            sum[i] += p[i]
-
-    for i in range(4):
-        sum[i] //= 400
-    return sum
+def best_pixel(y, integrals: IntegralImage):
+    """Mean color of row y (rounded down)"""
+    return list(integrals.sum(0, y, 400, y + 1) // 400)
 
 def to_color(color):
     return "[{}, {}, {}, {}]".format(int(color[0]), int(color[1]), int(color[2]), int(color[3]))
@@ -49,9 +43,10 @@ def solve_dp(problem, size):
     prefix_sums = np.zeros((size + 1, 4))
 
     pixels = open_as_np(problem)
+    integrals = IntegralImage(pixels)
 
     for y in range(size):
-        rows[y,:] = best_pixel(y, pixels)[:]
+        rows[y,:] = best_pixel(y, integrals)[:]
 
     for y in range(1, size + 1):
         prefix_sums[y] = prefix_sums[y - 1] + rows[y - 1]
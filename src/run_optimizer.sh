@@ -1,11 +1,6 @@
-for j in `jot - 2 25`; do 
-    java -jar optimizer/target/optimizer.jar solutions/best/$j.txt solutions/optimized/$j.txt problems/$j.png ;
-done;
-
-for j in `jot - 26 35`; do
-    java -jar optimizer/target/optimizer.jar solutions/best/$j.txt solutions/optimized/$j.txt problems/$j.png problems/$j.initial.json;
-done;
+JOBS=${JOBS:-1}
+ROUNDS=${ROUNDS:-1}
 
-for j in `jot - 36 40`; do 
-    java -jar optimizer/target/optimizer.jar solutions/best/$j.txt solutions/optimized/$j.txt problems/$j.png;
+for j in `seq 2 40`; do
+    python3 -m solver.optimizer solutions/best/$j.txt solutions/optimized/$j.txt $j $JOBS $ROUNDS;
 done;
@@ -0,0 +1,121 @@
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+
+import solver.interpreter as interpreter
+import solver.islb as islb
+
+## Usage:
+## python3 -m src.score_corpus [FOLDER ...]
+##
+## Scores every solution under the folders (default: solutions and best_solutions)
+## with the local interpreter across a process pool and prints the best local
+## solution of every problem. Scores are stored in ./cache/scores.sqlite keyed by
+## (problem, sha256 of the program), so re-runs only score new or changed files.
+## Errors are stored too; all rows are dropped when SCORES_VERSION changes.
+
+DB_PATH = "./cache/scores.sqlite"
+# bump when the interpreter accepts, rejects or scores programs differently
+SCORES_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    problem INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    cost INTEGER,
+    similarity INTEGER,
+    total INTEGER,
+    error TEXT,
+    PRIMARY KEY (problem, sha256)
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    problem INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+"""
+
+# per worker process
+TARGETS = {}
+INITIAL_STATES = {}
+
+
+def score_file(job):
+    path, n, sha = job
+    if n not in TARGETS:
+        TARGETS[n] = interpreter.open_as_np(n)
+        INITIAL_STATES[n] = interpreter.load_initial_state(n)
+    try:
+        program = islb.load_compiled(path, INITIAL_STATES[n])
+        result = interpreter.Interpreter(TARGETS[n], INITIAL_STATES[n]).run_compiled(program)
+        return (n, sha, result.cost, result.similarity, result.total, None)
+    except (interpreter.InvalidMove, UnicodeDecodeError, SyntaxError, ValueError) as err:
+        return (n, sha, None, None, None, str(err))
+    except Exception as err:
+        # one broken file must not abort the whole corpus
+        return (n, sha, None, None, None, f"{type(err).__name__}: {err}")
+
+
+def hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def update_scores(db, folders, processes=None):
+    files = [(path, islb.problem_of(path), hash_file(path)) for path in islb.solution_files(folders)]
+    db.execute("DELETE FROM files")
+    db.executemany("INSERT INTO files VALUES (?, ?, ?)", files)
+
+    known = set(db.execute("SELECT problem, sha256 FROM scores"))
+    jobs = {}
+    for path, n, sha in files:
+        if (n, sha) not in known:
+            jobs.setdefault((n, sha), (path, n, sha))
+    print(f"{len(files)} files, {len(jobs)} new programs to score")
+
+    if jobs:
+        with multiprocessing.Pool(processes) as pool:
+            for row in pool.imap_unordered(score_file, jobs.values(), chunksize=8):
+                db.execute("INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?)", row)
+    db.commit()
+
+
+def leaderboard(db):
+    """Best valid local solution of every problem"""
+    return db.execute("""
+        SELECT f.problem, MIN(s.total), s.cost, s.similarity, f.path, COUNT(DISTINCT f.sha256)
+        FROM files f JOIN scores s ON s.problem = f.problem AND s.sha256 = f.sha256
+        WHERE s.error IS NULL
+        GROUP BY f.problem
+        ORDER BY f.problem
+    """).fetchall()
+
+
+def main():
+    folders = sys.argv[1:] or ["solutions", "best_solutions"]
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    db = sqlite3.connect(DB_PATH)
+    db.executescript(SCHEMA)
+    if db.execute("PRAGMA user_version").fetchone()[0] != SCORES_VERSION:
+        # scored by another version of the interpreter
+        db.execute("DELETE FROM scores")
+        db.execute(f"PRAGMA user_version = {SCORES_VERSION}")
+        db.commit()
+
+    start = time.time()
+    update_scores(db, folders)
+    print(f"Scored in {time.time() - start:.2f}s\n")
+
+    print(f"{'problem':>7} {'total':>7} {'cost':>7} {'simil':>7} {'programs':>8}  path")
+    grand_total = 0
+    for n, total, cost, similarity, path, count in leaderboard(db):
+        grand_total += total
+        print(f"{n:>7} {total:>7} {cost:>7} {similarity:>7} {count:>8}  {path}")
+    print(f"\nTotal: {grand_total}")
+
+
+if __name__ == "__main__":
+    main()
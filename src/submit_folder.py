@@ -8,6 +8,8 @@ import sys
 import os.path
 
 from server.api import icfpc
+import solver.interpreter as interpreter
+import solver.islb as islb
 
 
 def main():
@@ -20,10 +22,18 @@ def main():
     for n in range(1, 41):
         fname = f"{path}/{n}.txt"
         if os.path.isfile(fname):
-            print("Sending file", fname)
-            with open(fname, "rt") as f:
-                code = f.read()
-                icfpc.submit(n, code)
+            with open(fname, "rb") as f:
+                data = f.read()
+            code = data.decode()
+            initial = interpreter.load_initial_state(n)
+            errors = interpreter.check_program(code, initial)
+            if errors:
+                print(f"Skipping invalid solution {fname}:", *errors, sep="\n  ")
+                continue
+            program = islb.compile_cached(data, initial)
+            result = interpreter.Interpreter(interpreter.open_as_np(n), initial).run_compiled(program)
+            print(f"Sending file {fname}, local score: {result.total} (cost {result.cost}, similarity {result.similarity})")
+            icfpc.submit(n, code)
             
 if __name__ == "__main__":
     main()